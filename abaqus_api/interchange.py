@@ -0,0 +1,125 @@
+# -*- coding:utf-8 -*-
+# interchange.py
+# 布置和结果文件的读写, 按扩展名区分两种格式:
+#   .json  原来的json格式, 所有字段都在一个字典里
+#   .npz   二进制格式, 坐标列表存为float64数组, 其余字段作为json头存为uint8数组
+# 二进制的结果文件只保存新增的字段, 用"input"字段引用输入文件, 读取时再合并。
+# 本脚本只依赖numpy, 可以在abaqus自带的python 2.7和python 3中使用。
+
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+# 按float64数组保存的字段
+ARRAY_KEYS = ('xcoord', 'ycoord', 'incoord', 'xcoord_3d', 'ycoord_3d', 'incoord_3d', 'bound_pts', 'inner_pts')
+HEADER_KEY = 'header'
+INPUT_KEY = 'input'
+
+
+def is_binary(path):
+    return path.endswith(".npz")
+
+
+def to_bytes(arr):
+    # 老版本的numpy没有tobytes
+    if hasattr(arr, 'tobytes'):
+        return arr.tobytes()
+    return arr.tostring()
+
+
+@contextmanager
+def atomic_open(path, mode="w"):
+    """先写临时文件, 写完后再改名为path, 读的一方不会读到写了一半的文件。
+    :param path: 目标文件
+    :param mode: 打开临时文件的模式
+    :return: 临时文件对象
+    """
+    tmp = path + ".tmp"
+    with open(tmp, mode) as f:
+        yield f
+    if hasattr(os, "replace"):
+        os.replace(tmp, path)
+    else:
+        # python 2.7没有os.replace, windows上不能改名覆盖已有的文件
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp, path)
+
+
+def save_npz(path, d):
+    arrays = {}
+    header = {}
+    for k, v in d.items():
+        if k in ARRAY_KEYS:
+            arrays[k] = np.asarray(v, dtype=np.float64)
+        else:
+            header[k] = v
+    arrays[HEADER_KEY] = np.frombuffer(json.dumps(header, default=to_list).encode('utf-8'), dtype=np.uint8)
+    with atomic_open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def load_npz(path, resolve=True):
+    # 老版本的numpy中NpzFile不支持with语句
+    data = np.load(path)
+    try:
+        d = json.loads(to_bytes(data[HEADER_KEY]).decode('utf-8'))
+        for k in ARRAY_KEYS:
+            if k in data.files:
+                d[k] = data[k].tolist()
+    finally:
+        data.close()
+    if resolve and INPUT_KEY in d:
+        base = load_data(os.path.join(os.path.dirname(path), d[INPUT_KEY]))
+        base.update(d)
+        d = base
+    return d
+
+
+def load_data(path):
+    """按扩展名读取json或npz文件。
+    :param path:
+    :return: 字典, npz中的数组转换为列表; 结果文件会合并它引用的输入文件
+    """
+    if is_binary(path):
+        return load_npz(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def to_list(v):
+    # json.dumps的default, 把numpy数组和标量转换成列表和float
+    if hasattr(v, 'tolist'):
+        return v.tolist()
+    raise TypeError("%r is not JSON serializable" % (v,))
+
+
+def save_data(path, d):
+    """按扩展名保存为json或npz文件。
+    :param path:
+    :param d: 字典
+    :return:
+    """
+    if is_binary(path):
+        save_npz(path, d)
+    else:
+        with open(path, "w") as f:
+            f.writelines(json.dumps(d, indent=4, default=to_list))
+
+
+def save_result(path, d_in, d, input_path):
+    """保存计算结果。npz格式只保存d中新增的字段和对输入文件的引用, json格式保存整个d。
+    :param path: 结果文件
+    :param d_in: 输入字典
+    :param d: 结果字典
+    :param input_path: 输入文件, 与结果文件在同一个目录中
+    :return:
+    """
+    if is_binary(path):
+        payload = dict((k, v) for k, v in d.items() if k not in d_in)
+        payload[INPUT_KEY] = os.path.basename(input_path)
+        save_npz(path, payload)
+    else:
+        save_data(path, d)
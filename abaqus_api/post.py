@@ -7,8 +7,25 @@
 import shelve
 import json
 from odbAccess import *
-from numpy import array, array2string, std, zeros
+from numpy import absolute, arange, argsort, array, array2string, asarray, floor, hstack, int64, minimum, \
+    searchsorted, std, zeros
+import inspect
+import math
 import os
+import sys
+
+# 与本脚本同目录的interchange.py, 用于读写json和npz两种格式
+script_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+from interchange import is_binary, load_data, save_result
+
+
+# 量化后(x, y)两个整数键合成一个int64时y键的基数
+KEY_BASE = 2 ** 31
+
+# pre.py中建立的边界点和内部点的assembly集合
+OUTPUT_SET_NAMES = ('PartA_Boundary', 'PartB_Boundary', 'PartA_Inner', 'PartB_Inner')
 
 
 def isSamePoint(point1, point2, err=0.0002):
@@ -28,6 +45,31 @@ def isSetPoints(inputPoint, innerPointLst, err=0.0002):
     return False
 
 
+class PointSet(object):
+    """
+    按量化后的(x, y)分桶的点集合。
+    桶的边长等于精度err, 判断时只需检查相邻的9个桶, 每个节点的分类是O(1)的。
+    """
+
+    def __init__(self, pointLst, err=0.0002):
+        self.err = err
+        self.buckets = {}
+        for point in pointLst:
+            self.buckets.setdefault(self.key(point), []).append(point)
+
+    def key(self, point):
+        return int(math.floor(point[0] / self.err)), int(math.floor(point[1] / self.err))
+
+    def __contains__(self, inputPoint):
+        kx, ky = self.key(inputPoint)
+        for i in (kx - 1, kx, kx + 1):
+            for j in (ky - 1, ky, ky + 1):
+                for point in self.buckets.get((i, j), ()):
+                    if isSamePoint(inputPoint, point, self.err):
+                        return True
+        return False
+
+
 def stderr(pointlst):
     # To compute the standard error of z direction deformation.
     temp_z = []
@@ -37,9 +79,152 @@ def stderr(pointlst):
     return stderr
 
 
-def get_node_deformation(odb, d_in, step_name):
+def valuesDeformation(fieldOutput, boundPointLst, innerPointLst):
+    """
+    逐个FieldValue提取边界点和内部点的变形。
+    :return: (边界点列表, 内部点列表), 每个点为[x, y, z, x', y', z']
+    """
+    innerPointsDeformed = []
+    boundPointsDeformed = []
+
+    # 边界点和内部点的坐标只建一次索引
+    boundPointSet = PointSet(boundPointLst)
+    innerPointSet = PointSet(innerPointLst)
+
+    for value in fieldOutput.values:
+        # 当模型中存在connector时该instance为None,需要跳过
+        if value.instance == None:
+            continue
+        nodeLabel = value.nodeLabel
+        checkLabel = value.instance.nodes[value.nodeLabel - 1].label
+        if nodeLabel == checkLabel:
+            deformationVector = array(value.data)
+            orignalCoordinate = array(
+                value.instance.nodes[value.nodeLabel - 1].coordinates)
+            # 此处判断该点是否为边界点
+            if orignalCoordinate in boundPointSet:
+                tempArray = zeros(6, float)
+                tempArray[:3] = orignalCoordinate
+                tempArray[3:] = orignalCoordinate + deformationVector
+                # To Json
+                tempArray = list(tempArray)
+                boundPointsDeformed.append(tempArray)
+            elif (orignalCoordinate[0] % 1.0 == 0 and orignalCoordinate[1] % 1.0 == 0) \
+                    and orignalCoordinate in innerPointSet:
+                tempArray = zeros(6, float)
+                tempArray[:3] = orignalCoordinate
+                tempArray[3:] = orignalCoordinate + deformationVector
+                # To Json
+                tempArray = list(tempArray)
+                innerPointsDeformed.append(tempArray)
+        else:
+            print('Wrong point, Label is %d' % nodeLabel)
+    return boundPointsDeformed, innerPointsDeformed
+
+
+def isSetPointsMask(coordinates, pointLst, err=0.0002):
+    """
+    向量化的isSetPoints。coordinates为(n, 3)的节点坐标数组, 返回长度为n的布尔数组。
+    pointLst按量化后的(x, y)排序, 每个节点在相邻的9个桶里用searchsorted查找。
+    同一个桶中可能有多个点, 按桶内序号分层, 每层内的键唯一。
+    """
+    mask = zeros(len(coordinates), bool)
+    if len(coordinates) == 0 or len(pointLst) == 0:
+        return mask
+    xy = array(pointLst, float)[:, :2]
+    keys = floor(xy / err).astype(int64)
+    combined = keys[:, 0] * KEY_BASE + keys[:, 1]
+    order = argsort(combined, kind='mergesort')
+    combined, xy = combined[order], xy[order]
+    rank = arange(len(combined)) - searchsorted(combined, combined, side='left')
+
+    nodeXY = asarray(coordinates, float)[:, :2]
+    nodeKeys = floor(nodeXY / err).astype(int64)
+    for r in range(rank.max() + 1):
+        layer = rank == r
+        layerKeys, layerXY = combined[layer], xy[layer]
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                query = (nodeKeys[:, 0] + dx) * KEY_BASE + (nodeKeys[:, 1] + dy)
+                pos = minimum(searchsorted(layerKeys, query), len(layerKeys) - 1)
+                found = layerKeys[pos] == query
+                near = absolute(nodeXY - layerXY[pos]).sum(axis=1) < err
+                mask |= found & near
+    return mask
+
+
+def instanceNodes(instance, cache):
+    """
+    每个instance只建一次节点数组: 按label排序的label数组和对应的坐标数组。
+    """
+    if instance.name not in cache:
+        labels = array([node.label for node in instance.nodes], int64)
+        coordinates = array([node.coordinates for node in instance.nodes], float)
+        order = argsort(labels)
+        cache[instance.name] = (labels[order], coordinates[order])
+    return cache[instance.name]
+
+
+def bulkDeformation(fieldOutput, boundPointLst, innerPointLst, cache=None):
+    """
+    按bulkDataBlocks整块提取位移, 节点坐标按instance整块查找, 分类和输出用numpy向量化完成。
+    :param cache: instanceNodes的缓存, 同一个odb的多个子集共用一个, 每个instance的节点数组只建一次
+    :return: (边界点列表, 内部点列表), 每个点为[x, y, z, x', y', z']
+    """
+    boundRows = []
+    innerRows = []
+    if cache is None:
+        cache = {}
+    for block in fieldOutput.bulkDataBlocks:
+        # 当模型中存在connector时该instance为None,需要跳过
+        if block.instance == None:
+            continue
+        labels, coordinates = instanceNodes(block.instance, cache)
+        nodeLabels = array(block.nodeLabels, int64)
+        pos = minimum(searchsorted(labels, nodeLabels), len(labels) - 1)
+        valid = labels[pos] == nodeLabels
+        for nodeLabel in nodeLabels[~valid]:
+            print('Wrong point, Label is %d' % nodeLabel)
+
+        orignalCoordinate = coordinates[pos[valid]]
+        deformationVector = array(block.data, float)[valid]
+        rows = hstack((orignalCoordinate, orignalCoordinate + deformationVector))
+
+        # 此处判断该点是否为边界点
+        isBound = isSetPointsMask(orignalCoordinate, boundPointLst)
+        onGrid = (orignalCoordinate[:, 0] % 1.0 == 0) & (orignalCoordinate[:, 1] % 1.0 == 0)
+        isInner = ~isBound & onGrid & isSetPointsMask(orignalCoordinate, innerPointLst)
+        boundRows.append(rows[isBound])
+        innerRows.append(rows[isInner])
+
+    # To Json
+    boundPointsDeformed = [row for rows in boundRows for row in rows.tolist()]
+    innerPointsDeformed = [row for rows in innerRows for row in rows.tolist()]
+    return boundPointsDeformed, innerPointsDeformed
+
+
+def outputSubsets(odb, fieldOutput):
+    """
+    按pre.py中建立的边界点和内部点集合取fieldOutput的子集。
+    odb中集合名是大写的; 若odb中没有这些集合, 退回到整个fieldOutput。
+    """
+    nodeSets = odb.rootAssembly.nodeSets
+    subsets = []
+    for setName in OUTPUT_SET_NAMES:
+        if setName.upper() in nodeSets.keys():
+            subsets.append(fieldOutput.getSubset(region=nodeSets[setName.upper()]))
+        else:
+            print('Node set %s not found in odb, read all nodes instead.' % setName)
+            return [fieldOutput]
+    return subsets
+
+
+def get_node_deformation(odb, d_in, step_name, bulk=True, subset=True, input_file=None):
     """
     :param odb打开的odb对象
+    :param bulk: 为True时按bulkDataBlocks整块提取, 否则逐个FieldValue提取
+    :param subset: 为True时只读取pre.py中建立的点集合上的节点
+    :param input_file: d_in所在的文件, 为npz时结果也保存为npz, 只保存新增的字段和对input_file的引用
     """
 
     # 起吊点高度和位置
@@ -71,37 +256,23 @@ def get_node_deformation(odb, d_in, step_name):
 
     d = d_in.copy()
 
+    fieldOutput = final_frame.fieldOutputs['U']
+    if subset:
+        fieldOutputs = outputSubsets(odb, fieldOutput)
+    else:
+        fieldOutputs = [fieldOutput]
+
     innerPointsDeformed = []
     boundPointsDeformed = []
-
-    for value in final_frame.fieldOutputs['U'].values:
-        # 当模型中存在connector时该instance为None,需要跳过
-        if value.instance == None:
-            continue
-        nodeLabel = value.nodeLabel
-        checkLabel = value.instance.nodes[value.nodeLabel - 1].label
-        if nodeLabel == checkLabel:
-            deformationVector = array(value.data)
-            orignalCoordinate = array(
-                value.instance.nodes[value.nodeLabel - 1].coordinates)
-            # 此处判断该点是否为边界点
-            if isSetPoints(orignalCoordinate, xcoord_3d) or isSetPoints(orignalCoordinate, ycoord_3d):
-                tempArray = zeros(6, float)
-                tempArray[:3] = orignalCoordinate
-                tempArray[3:] = orignalCoordinate + deformationVector
-                # To Json
-                tempArray = list(tempArray)
-                boundPointsDeformed.append(tempArray)
-            elif (orignalCoordinate[0] % 1.0 == 0 and orignalCoordinate[1] % 1.0 == 0) \
-                    and isSetPoints(orignalCoordinate, incoord_3d):
-                tempArray = zeros(6, float)
-                tempArray[:3] = orignalCoordinate
-                tempArray[3:] = orignalCoordinate + deformationVector
-                # To Json
-                tempArray = list(tempArray)
-                innerPointsDeformed.append(tempArray)
+    # 各子集的节点属于相同的instance, 节点数组只建一次
+    cache = {}
+    for fieldOutput in fieldOutputs:
+        if bulk:
+            bound, inner = bulkDeformation(fieldOutput, xcoord_3d + ycoord_3d, incoord_3d, cache)
         else:
-            print('Wrong point, Label is %d' % nodeLabel)
+            bound, inner = valuesDeformation(fieldOutput, xcoord_3d + ycoord_3d, incoord_3d)
+        boundPointsDeformed.extend(bound)
+        innerPointsDeformed.extend(inner)
 
     d['bound_pts'] = boundPointsDeformed
     d['inner_pts'] = innerPointsDeformed
@@ -110,17 +281,16 @@ def get_node_deformation(odb, d_in, step_name):
     # with open(odb_name + ".json", "w") as f:
     #     f.writelines(json.dumps(d, indent=4))
 
-    result_file = json_save_dir + "/" + res_file_prefix + odb_name + ".json"
-    with open(result_file, "w") as f:
-        f.writelines(json.dumps(d, indent=4))
+    ext = ".npz" if input_file is not None and is_binary(input_file) else ".json"
+    result_file = json_save_dir + "/" + res_file_prefix + odb_name + ext
+    save_result(result_file, d_in, d, input_file)
 
     print("Finished!")
 
 
 if __name__ == '__main__':
     json_file = os.environ.get("JSON", failobj="test_init.json")
-    with open(json_file, "r") as f:
-        d = json.load(f)
+    d = load_data(json_file)
 
     # 保存的文件名，提交的计算作业名
     mdb_name = str(d['mdb_name'])
@@ -133,7 +303,7 @@ if __name__ == '__main__':
 
     odb = openOdb(path=odb_name + ".odb")
     try:
-        get_node_deformation(odb=odb, d_in=d, step_name=deformation_step_name)
+        get_node_deformation(odb=odb, d_in=d, step_name=deformation_step_name, input_file=json_file)
     except Exception as e:
         print(e)
     finally:
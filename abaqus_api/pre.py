@@ -13,21 +13,28 @@ from job import *
 from sketch import *
 from visualization import *
 from connectorBehavior import *
+import inspect
 import math
 import os
 import shelve
+import sys
 import argparse
 import json
 
+# 与本脚本同目录的interchange.py, 用于读写json和npz两种格式
+script_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+from interchange import load_data
+
 # parser = argparse.ArgumentParser()
 # parser.add_argument("json_path")
 # args = parser.parse_args()
 
 json_file = os.environ.get("JSON", failobj="test_init.json")
 
-with open(json_file, "r") as f:
-    print("Now load data from %s" % json_file)
-    d = json.load(f)
+print("Now load data from %s" % json_file)
+d = load_data(json_file)
 
 # f = shelve.open('D:/abaqus_execpy/_sym/model-files/sym-40-3.dat')
 
@@ -138,6 +145,12 @@ setForConnector = myAssembly.SetByBoolean(
     sets=[set_PartA_BoundaryPoints, set_PartB_BoundaryPoints],
     operation=UNION,
 )
+# 后处理只需要这些点的位移
+set_OutputPoints = myAssembly.SetByBoolean(
+    name='OutputPoints',
+    sets=[set_PartA_BoundaryPoints, set_PartB_BoundaryPoints, set_PartA_InnerPoints, set_PartB_InnerPoints],
+    operation=UNION,
+)
 
 # 沿向量vect平移PartA，用于考虑连接件长度
 myAssembly.translate(instanceList=('PartA',), vector=vector)
@@ -216,6 +229,15 @@ Step_1 = myModel.StaticStep(
     previous='Initial',
     nlgeom=ON,
     solutionTechnique=FULL_NEWTON)
+
+# 只在最后一个增量步输出边界点和内部点的位移U, 减小odb的大小
+del myModel.fieldOutputRequests['F-Output-1']
+myModel.FieldOutputRequest(
+    name='F-Output-Points',
+    createStepName=deformation_step_name,
+    region=set_OutputPoints,
+    variables=('U',),
+    frequency=LAST_INCREMENT)
 # Step_1.setValues(initialInc=0.00025,
 #                  maxInc=0.1,
 #                  maxNumInc=0X7FFFFFFF,
@@ -365,3 +387,7 @@ print "Now Job created!"
 submitJob.submit(consistencyChecking=OFF)
 print "Now Job submitted!"
 
+# 阻塞到作业结束, 后处理之前odb已经完整写出
+submitJob.waitForCompletion()
+job_status = str(submitJob.status)
+print "Now Job finished with status %s!" % job_status
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# pre_solve_post.py
+# 在同一个CAE进程中依次完成建模和求解(pre.py, 阻塞到作业结束)、检查作业状态、后处理(post.py)。
+# 结果状态写入与JSON同名的.status.json文件, 供RunAbaqus读取:
+# {"ok": true/false, "stage": "pre"/"solve"/"post"/"done", "job_status": ..., "error": ..., "duration": {...}}
+
+from abaqus import *
+from abaqusConstants import *
+from odbAccess import openOdb
+import inspect
+import json
+import os
+import time
+import traceback
+
+script_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+json_file = os.path.abspath(os.environ.get("JSON", "test_init.json"))
+status_file = os.path.splitext(json_file)[0] + ".status.json"
+
+
+def run_file(file_name, ns):
+    path = os.path.join(script_dir, file_name)
+    with open(path, "r") as f:
+        code = compile(f.read(), path, 'exec')
+    exec(code, ns)
+    return ns
+
+
+def write_status(status):
+    tmp = status_file + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(json.dumps(status, indent=4))
+    if os.path.exists(status_file):
+        os.remove(status_file)
+    os.rename(tmp, status_file)
+
+
+status = {'ok': False, 'stage': 'pre', 'job_status': None, 'error': None, 'duration': {}}
+cwd = os.getcwd()
+try:
+    start = time.time()
+    pre = run_file("pre.py", {'__name__': '__main__', 'mdb': mdb})
+    status['duration']['pre'] = time.time() - start
+
+    status['stage'] = 'solve'
+    status['job_status'] = pre['job_status']
+    if pre['job_status'] != str(COMPLETED):
+        raise Exception("Job %s finished with status %s" % (pre['odb_name'], pre['job_status']))
+
+    status['stage'] = 'post'
+    start = time.time()
+    post = run_file("post.py", {'__name__': 'post'})
+    d = pre['d']
+    odb = openOdb(path=str(d['odb_name']) + ".odb")
+    try:
+        post['get_node_deformation'](odb=odb, d_in=d, step_name=str(d['deformation_step_name']),
+                                     input_file=json_file)
+    finally:
+        odb.close()
+    status['duration']['post'] = time.time() - start
+
+    status['stage'] = 'done'
+    status['ok'] = True
+except Exception:
+    status['error'] = traceback.format_exc()
+    print(status['error'])
+finally:
+    os.chdir(cwd)
+    write_status(status)
@@ -0,0 +1,126 @@
+# -*- coding:utf-8 -*-
+# worker.py
+# 常驻的CAE worker, 避免每次迭代都冷启动abaqus cae。
+# 用法: abq6142.exe cae noGUI=worker.py, 环境变量WORKER_DIR指定请求目录,
+# WORKER_TOKEN区分不同次启动的worker(默认为进程号)。
+# 本脚本不依赖abaqus的模块, 直接用python运行时可作为worker的替身, 用于测试。
+#
+# 请求目录中的文件:
+#   <id>.req   客户端写入的请求, {"script": 脚本路径, "json": json文件路径, "cwd": 工作目录}
+#              或者{"stop": true}让worker退出
+#   <id>.<token>.run   worker正在执行的请求, token为领取请求的worker的WORKER_TOKEN
+#   <id>.res   执行结果, {"id": ..., "ok": true/false, "error": ..., "duration": 秒}
+#   heartbeat  worker存活时每隔HEARTBEAT_INTERVAL秒更新一次; CAE中长时间求解时可能停止更新,
+#              客户端在存在本次启动的worker领取的<id>.<token>.run时只检查进程是否还在
+
+import json
+import os
+import threading
+import time
+import traceback
+
+HEARTBEAT_INTERVAL = 1.0
+POLL_INTERVAL = 0.2
+
+
+def write_atomic(path, d):
+    # 先写临时文件再改名, 客户端不会读到写了一半的文件
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(json.dumps(d))
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+def heartbeat(worker_dir, stop_event):
+    path = os.path.join(worker_dir, "heartbeat")
+    while not stop_event.is_set():
+        with open(path, "w") as f:
+            f.write("%f" % time.time())
+        stop_event.wait(HEARTBEAT_INTERVAL)
+
+
+def script_namespace(script):
+    # 在CAE中运行时, 脚本依赖abaqus注入到__main__中的mdb, session等对象
+    ns = {'__name__': '__main__', '__file__': script}
+    try:
+        exec('from abaqus import *\nfrom abaqusConstants import *', ns)
+    except ImportError:
+        pass
+    return ns
+
+
+def reset_mdb():
+    # 每个作业开始前新建一个空的模型数据库, 避免模型在常驻进程中累积
+    try:
+        from abaqus import Mdb
+    except ImportError:
+        return
+    Mdb()
+
+
+def run_job(req):
+    script = req['script']
+    cwd = os.getcwd()
+    start = time.time()
+    out = {'ok': True, 'error': None}
+    try:
+        os.environ['JSON'] = req['json']
+        if req.get('cwd'):
+            os.chdir(req['cwd'])
+        reset_mdb()
+        with open(script, "r") as f:
+            code = compile(f.read(), script, 'exec')
+        exec(code, script_namespace(script))
+    except (Exception, SystemExit):
+        out['ok'] = False
+        out['error'] = traceback.format_exc()
+        print(out['error'])
+    finally:
+        os.chdir(cwd)
+    out['duration'] = time.time() - start
+    return out
+
+
+def serve(worker_dir, token):
+    stop_event = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(worker_dir, stop_event))
+    beat.daemon = True
+    beat.start()
+    print("Worker is serving %s" % worker_dir)
+    try:
+        while True:
+            requests = sorted(name for name in os.listdir(worker_dir) if name.endswith(".req"))
+            if not requests:
+                time.sleep(POLL_INTERVAL)
+                continue
+            for name in requests:
+                job_id = name[:-len(".req")]
+                running = os.path.join(worker_dir, "%s.%s.run" % (job_id, token))
+                try:
+                    os.rename(os.path.join(worker_dir, name), running)
+                except OSError:
+                    continue
+                with open(running, "r") as f:
+                    req = json.load(f)
+                if req.get('stop'):
+                    os.remove(running)
+                    write_atomic(os.path.join(worker_dir, job_id + ".res"), {'id': job_id, 'ok': True, 'error': None})
+                    return
+                print("Now run %s with %s" % (req['script'], req['json']))
+                out = run_job(req)
+                out['id'] = job_id
+                write_atomic(os.path.join(worker_dir, job_id + ".res"), out)
+                os.remove(running)
+    finally:
+        stop_event.set()
+        beat.join()
+        hb = os.path.join(worker_dir, "heartbeat")
+        if os.path.exists(hb):
+            os.remove(hb)
+        print("Worker stopped.")
+
+
+if __name__ == '__main__':
+    serve(os.environ.get("WORKER_DIR", os.getcwd()), os.environ.get("WORKER_TOKEN", str(os.getpid())))
@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+"""
+几何和迭代相关函数的基准测试, 不依赖abaqus和E:/AbaqusDir, 全部使用合成的控制点和结果。
+每个跨度分别计时, 与benchmark/baseline.json中保存的基准比较, 变慢超过tolerance倍时返回非0。
+用法:
+    python -m benchmark.kernels_bench            # 与基准比较
+    python -m benchmark.kernels_bench --save     # 重新生成基准
+    python -m benchmark.kernels_bench --spans 40 100 --only InitPlain
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from math import ceil
+
+import numpy as np
+
+from benchmark.ycoord_bench import SPANS, synthetic_boundary
+from src.utils.interchange import load_data, save_data
+from src.utils.iter import Iteration
+from src.utils.utils import Common, GenerateAbaqusData, GenerateCoord, InitPlain
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# 超过基准多少倍算作变慢
+TOLERANCE = 1.5
+# 每次计时至少持续的时间(秒), 耗时很短的函数重复多次再取平均
+MIN_TIME = 0.05
+
+
+def measure(func, repeat=3, min_time=MIN_TIME):
+    """与timeit类似, 先估计一次调用的耗时, 决定每次计时调用的次数。
+    :return: 每次调用的耗时(秒), 取repeat次计时中最短的
+    """
+    t0 = time.perf_counter()
+    func()
+    once = time.perf_counter() - t0
+    number = max(1, int(ceil(min_time / max(once, 1e-9))))
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best
+
+
+def synthetic_result(plain):
+    """用平面布置构造odb结果格式的边界点和内部点, z取一个光滑的假想位移。
+    :param plain: InitPlain
+    :return: 含bound_pts和inner_pts的字典
+    """
+    members, _ = plain.layout.members()
+    bound = members.reshape(-1, 2)
+    inner = plain.layout.incoord
+    to_odb = lambda pts: np.column_stack((pts, np.zeros(len(pts)), pts, -0.005 * np.abs(pts[:, 1]))).tolist()
+    return {'bound_pts': to_odb(bound), 'inner_pts': to_odb(inner)}
+
+
+def abaqus_input(plain, save_dir):
+    return GenerateAbaqusData.to_json(
+        d_in=plain.layout, json_file_name="bench-2nd.json", res_file_prefix="res_",
+        json_save_dir=save_dir, abaqus_dir=save_dir, mdb_name="bench", odb_name="bench",
+        iter_time=0, left_hang=10, left_hang_height=5, right_hang=30, right_hang_height=5,
+        radius=0.02, thickness=0.003, elastic_modular=26E+09, density=1850, deformation_step_name="Step-1",
+    )
+
+
+def round_trip(d, path):
+    save_data(path, d)
+    return load_data(path)
+
+
+def cases(span, work_dir):
+    """一个跨度下要计时的函数。
+    :param span: 跨度
+    :param work_dir: 读写文件用的临时目录
+    :return: [(名称, 无参数的函数), ...]
+    """
+    pt_list = synthetic_boundary(span)
+    spl = Common.get_spl(pt_list)
+    plain = InitPlain(pt_list)
+    xcoord, ycoord = plain.xcoord, plain.ycoord
+    result = synthetic_result(plain)
+    iteration = Iteration(result, factor=0.3, seed=0)
+    d_in = abaqus_input(plain, work_dir)
+    return [
+        ("Common.root", lambda: [Common.root(spl, y, 0, span, scan_step=0.005)
+                                 for y in np.linspace(0.1, 0.3, 5) * span]),
+        ("generate_ycoord", lambda: GenerateCoord.generate_ycoord(spl, 0, span, 1.0)),
+        ("generate_ycoord_ppoly", lambda: GenerateCoord.generate_ycoord(spl, 0, span, 1.0, method="ppoly")),
+        ("generate_incoord", lambda: GenerateCoord.generate_incoord(xcoord, ycoord)),
+        ("InitPlain", lambda: InitPlain(pt_list)),
+        ("get_b_in_pairs", lambda: Iteration.get_b_in_pairs(result['bound_pts'], result['inner_pts'])),
+        ("reduce_pts", lambda: iteration.reduce_pts(seed=0)),
+        ("json_round_trip", lambda: round_trip(d_in, os.path.join(work_dir, "bench.json"))),
+        ("npz_round_trip", lambda: round_trip(d_in, os.path.join(work_dir, "bench.npz"))),
+    ]
+
+
+def run(spans=SPANS, only=None, repeat=3):
+    """
+    :param spans: 跨度
+    :param only: 只计时这些名称的函数, 为None时全部计时
+    :param repeat: 每个函数计时的次数, 取最短的耗时
+    :return: {"span/名称": 秒}
+    """
+    timings = dict()
+    work_dir = tempfile.mkdtemp()
+    try:
+        # 丢掉被计时的函数中的print
+        with redirect_stdout(io.StringIO()):
+            for span in spans:
+                for name, func in cases(span, work_dir):
+                    if only is None or name in only:
+                        timings["%d/%s" % (span, name)] = measure(func, repeat)
+    finally:
+        shutil.rmtree(work_dir)
+    return timings
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return dict()
+    with open(path, "r") as f:
+        return json.load(f)["timings"]
+
+
+def save_baseline(timings, path=BASELINE_FILE):
+    d = {
+        "machine": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform()},
+        "timings": dict((k, round(v, 6)) for k, v in sorted(timings.items())),
+    }
+    with open(path, "w") as f:
+        f.write(json.dumps(d, indent=4))
+
+
+def compare(timings, baseline, tolerance=TOLERANCE):
+    """打印与基准的比较。
+    :return: 变慢超过tolerance倍的名称列表
+    """
+    slower = []
+    print("%-30s %10s %10s %8s" % ("case", "time(s)", "base(s)", "ratio"))
+    for key in sorted(timings, key=lambda k: (int(k.split("/")[0]), k)):
+        t = timings[key]
+        base = baseline.get(key)
+        if base is None:
+            print("%-30s %10.4f %10s %8s" % (key, t, "-", "-"))
+            continue
+        ratio = t / base if base > 0 else float("inf")
+        flag = ""
+        if ratio > tolerance:
+            slower.append(key)
+            flag = " SLOWER"
+        print("%-30s %10.4f %10.4f %7.2fx%s" % (key, t, base, ratio, flag))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="geometry and iteration benchmarks")
+    parser.add_argument("--spans", type=int, nargs="+", default=list(SPANS))
+    parser.add_argument("--only", nargs="+", default=None, help="case names to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--save", action="store_true", help="write the timings as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args(argv)
+
+    timings = run(args.spans, args.only, args.repeat)
+    if args.save:
+        baseline = load_baseline(args.baseline)
+        baseline.update(timings)
+        save_baseline(baseline, args.baseline)
+        print("baseline saved to %s" % args.baseline)
+        return 0
+    slower = compare(timings, load_baseline(args.baseline), args.tolerance)
+    if slower:
+        print("%d case(s) slower than %.2fx baseline: %s" % (len(slower), args.tolerance, ", ".join(slower)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
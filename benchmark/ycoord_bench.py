@@ -0,0 +1,43 @@
+# -*- coding:utf-8 -*-
+"""
+比较GenerateCoord.generate_ycoord中扫描求根(scan)和分段多项式求根(ppoly)两种方式的耗时。
+用法: python -m benchmark.ycoord_bench
+"""
+import time
+
+from src.utils.utils import Common, GenerateCoord
+
+SPANS = (40, 100, 200, 400)
+
+
+def synthetic_boundary(span):
+    """按跨度等比例放大测试用的边界控制点。
+    :param span: 跨度
+    :return: 控制点的列表
+    """
+    base = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+    k = span / 40.0
+    return [(x * k, y * k) for x, y in base]
+
+
+def best_of(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    print("%6s %8s %10s %10s %8s" % ("span", "members", "scan(s)", "ppoly(s)", "speedup"))
+    for span in SPANS:
+        spl = Common.get_spl(synthetic_boundary(span))
+        members = len(GenerateCoord.generate_ycoord(spl, 0, span, 1.0, method="ppoly"))
+        t_scan = best_of(lambda: GenerateCoord.generate_ycoord(spl, 0, span, 1.0, method="scan"))
+        t_ppoly = best_of(lambda: GenerateCoord.generate_ycoord(spl, 0, span, 1.0, method="ppoly"))
+        print("%6d %8d %10.4f %10.4f %7.1fx" % (span, members, t_scan, t_ppoly, t_scan / t_ppoly))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,66 @@
+import json
+import os
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from queue import Queue
+from random import getstate, setstate
+from threading import Lock
+
 from .utils import *
 
 
+class StopCriteria(object):
+    """
+    迭代的停止条件, 各条件为None时不检查。
+    stderr_tol: bound_stderr小于等于该值时停止, 只对abaqus的结果检查
+    window, min_improvement: 最近window次迭代的最小bound_stderr相对之前的最小值的改善小于min_improvement时停止
+    max_wall_time: 迭代的总耗时(秒)超过该值时停止
+    patience: 连续patience次迭代没有得到更小的bound_stderr时停止
+    近似计算和abaqus的bound_stderr不能相互比较, 每种精度分别记录,
+    stderr_tol, window/min_improvement和patience只对abaqus的结果检查, 窗口和次数也只计abaqus的迭代。
+    """
+
+    def __init__(self, stderr_tol=None, window=None, min_improvement=None, max_wall_time=None, patience=None):
+        self.stderr_tol = stderr_tol
+        self.window = window
+        self.min_improvement = min_improvement
+        self.max_wall_time = max_wall_time
+        self.patience = patience
+
+    def check(self, stderrs, elapsed, fidelity=None):
+        """
+        :param stderrs: 每种精度到目前为止每次迭代的bound_stderr, {fidelity: [...]};
+            为列表时看作fidelity这一种精度(fidelity为None时为abaqus)的结果
+        :param elapsed: 迭代已经用去的时间(秒)
+        :param fidelity: 最后一次迭代的精度
+        :return: 停止的原因, 不需要停止时返回None
+        """
+        if fidelity is None:
+            fidelity = Project.FIDELITY_ABAQUS
+        if not isinstance(stderrs, dict):
+            stderrs = {fidelity: stderrs}
+        if self.max_wall_time is not None and elapsed >= self.max_wall_time:
+            return "wall time %.1fs >= %.1fs" % (elapsed, self.max_wall_time)
+        stderrs = stderrs.get(Project.FIDELITY_ABAQUS)
+        # 最后一次是近似计算时abaqus的结果没有变化, 不需要再检查
+        if fidelity == Project.FIDELITY_CHEAP or not stderrs:
+            return None
+        last = stderrs[-1]
+        if self.stderr_tol is not None and last <= self.stderr_tol:
+            return "bound_stderr %g <= %g" % (last, self.stderr_tol)
+        if self.window is not None and self.min_improvement is not None and len(stderrs) > self.window:
+            before = min(stderrs[:-self.window])
+            recent = min(stderrs[-self.window:])
+            if before - recent < self.min_improvement * abs(before):
+                return "improvement in the last %d iterations < %g" % (self.window, self.min_improvement)
+        if self.patience is not None:
+            best = stderrs.index(min(stderrs))
+            if len(stderrs) - 1 - best >= self.patience:
+                return "no better bound_stderr in the last %d iterations" % self.patience
+        return None
+
+
 class Project(object):
     # json_path = "E:/AbaqusDir/auto/output"
     # abaqus_dir = "E:/AbaqusDir/sym-40/abaqus-files"
@@ -8,38 +68,189 @@ class Project(object):
     script_path = "E:/AbaqusDir/auto/abaqus_api"
     pre_script_name = "pre.py"
     post_script_name = "post.py"
+    FIDELITY_ABAQUS = "abaqus"
+    FIDELITY_CHEAP = "cheap"
 
-    def __init__(self, project_name, json_path, abaqus_dir, iter_times=10, step_factor=0.25, enable_rand=False):
+    def __init__(self, project_name, json_path, abaqus_dir, iter_times=10, step_factor=0.25, enable_rand=False,
+                 worker_dir=None, one_session=True,
+                 population=1, cpu_budget=None, licence_budget=None, cpus_per_job=4, tokens_per_job=8,
+                 verify_every=None, cheap_solver=None, cheap_tol=1e-3, stop_criteria=None,
+                 cache_dir=None, cache_entries=1000, binary=False, plot_every=1, incremental=False,
+                 metrics_file=None, metrics_sink=None, root_method="scan"):
         self.project_name = project_name
         self.json_path = json_path
         self.abaqus_dir = abaqus_dir
         self.enable_rand = enable_rand
-        self.abaqus_env = RunAbaqus(
+        self.iter_times = iter_times
+        self.step_factor = step_factor
+        # 给定worker_dir时启动常驻的CAE worker, 否则每个脚本启动一次cae。
+        # worker一次只执行一个请求, population>1时线程池的每个槽位在worker_dir/slot-<k>中各启动一个worker,
+        # 每个worker空闲时也占用一个cae的licence
+        self.worker_dir = worker_dir
+        # 为True时建模、求解、后处理在同一个cae进程中完成
+        self.one_session = one_session
+        self.res_file_prefix = "res_"
+        # population>1时每次迭代并发计算population个候选布置, 并发数受cpu_budget和licence_budget限制
+        self.population = population
+        self.cpu_budget = cpu_budget
+        self.licence_budget = licence_budget
+        self.cpus_per_job = cpus_per_job
+        self.tokens_per_job = tokens_per_job
+        # verify_every不为None时, 大部分迭代用cheap_solver(默认为LinearFrame)近似计算,
+        # 每verify_every次迭代或者近似计算的bound_stderr相对变化小于cheap_tol时用abaqus校核一次
+        self.verify_every = verify_every
+        self.cheap_solver = cheap_solver
+        self.cheap_tol = cheap_tol
+        # 每次计算的记录, {"time", "name", "fidelity", "cached", "bound_stderr", "duration"}
+        self.history = []
+        self.history_lock = Lock()
+        # 提前停止的条件, StopCriteria; 为None时迭代iter_times次
+        self.stop_criteria = stop_criteria
+        self.stop_reason = None
+        # 迭代中最好的布置, {"time", "pt_list", "fidelity", "bound_stderr"}
+        self.best = None
+        # 给定cache_dir时缓存abaqus的结果, 相同的布置不再重复计算
+        self.cache = ResultCache(cache_dir, max_entries=cache_entries) if cache_dir is not None else None
+        # 为True时布置和结果文件保存为npz, 结果文件只保存新增的字段和对输入文件的引用
+        self.ext = ".npz" if binary else ".json"
+        # 每plot_every次迭代保存一次示意图, 为None时不保存; run中在后台线程保存
+        self.plot_every = plot_every
+        self.plot_worker = None
+        # 为True时在上一次的平面布置的基础上增量生成, 只重新计算控制点变化影响到的杆件和交点
+        self.incremental = incremental
+        self.last_plain = None
+        # 同一次迭代中各候选布置的InitPlain, 选出最好的候选后作为下一次迭代的last_plain
+        self.candidate_plains = {}
+        # 求y方向杆件端点的方法, "scan"为逐点扫描, "ppoly"为分段多项式求根, 见GenerateCoord.generate_ycoord
+        self.root_method = root_method
+        # 每次迭代的分阶段耗时和计数写入jsonl文件(默认为json_path中的<project_name>.metrics.jsonl),
+        # 给定metrics_sink时同时调用metrics_sink(record); abaqus每次执行脚本的耗时也写在这里
+        if metrics_file is None:
+            metrics_file = "%s/%s.metrics.jsonl" % (json_path, project_name)
+        self.metrics = Metrics(metrics_file, metrics_sink)
+        self.metrics_record = None
+        self.abaqus_env = self.new_abaqus_env()
+        # 启动了worker的RunAbaqus, 空闲的放在idle_envs中; 没有启动worker时都用abaqus_env
+        self.abaqus_envs = [self.abaqus_env]
+        self.idle_envs = None
+
+    def new_abaqus_env(self):
+        env = RunAbaqus(
             abaqus_exe_path=self.abaqus_exe_path,
-            abaqus_dir=abaqus_dir,
+            abaqus_dir=self.abaqus_dir,
             script_path=self.script_path,
             pre_script=self.pre_script_name,
             post_script=self.post_script_name
         )
-        self.iter_times = iter_times
-        self.step_factor = step_factor
+        env.metrics = self.metrics
+        return env
+
+    def run(self, pt_list, resume=False):
+        self.start_workers()
+        self.plot_worker = PlotWorker()
+        try:
+            return self.iterate(pt_list, resume)
+        finally:
+            self.stop_workers()
+            self.plot_worker.close()
+            self.plot_worker = None
+
+    def start_workers(self, args=None):
+        """给定worker_dir时启动worker, population>1时为线程池的每个槽位各启动一个。
+        :param args: 启动worker的命令, 见RunAbaqus.start_worker
+        :return:
+        """
+        if self.worker_dir is None:
+            return
+        if self.population > 1:
+            self.abaqus_envs = [self.abaqus_env] + [self.new_abaqus_env() for _ in range(self.pool_size() - 1)]
+            worker_dirs = [os.path.join(self.worker_dir, "slot-%d" % k) for k in range(len(self.abaqus_envs))]
+        else:
+            worker_dirs = [self.worker_dir]
+        self.idle_envs = Queue()
+        for env, worker_dir in zip(self.abaqus_envs, worker_dirs):
+            env.start_worker(worker_dir, args=args)
+            self.idle_envs.put(env)
+
+    def stop_workers(self):
+        for env in self.abaqus_envs:
+            env.stop_worker()
+        self.abaqus_envs = [self.abaqus_env]
+        self.idle_envs = None
+
+    @contextmanager
+    def acquire_abaqus(self):
+        """取一个空闲的RunAbaqus, 用完后放回, 同一个worker不会同时执行两个候选布置。
+        没有启动worker时直接用abaqus_env。
+        """
+        idle_envs = self.idle_envs
+        if idle_envs is None:
+            yield self.abaqus_env
+            return
+        env = idle_envs.get()
+        try:
+            yield env
+        finally:
+            idle_envs.put(env)
+
+    @contextmanager
+    def iteration_metrics(self, time):
+        """一次迭代的记录, 迭代结束(包括提前停止和出错)时写出。
+        :param time: 迭代次数
+        :return: MetricsRecord
+        """
+        record = self.metrics.record("iteration", project=self.project_name, time=time)
+        self.metrics_record = record
+        try:
+            yield record
+        finally:
+            self.metrics_record = None
+            record.emit()
+
+    def stage(self, name):
+        """在当前迭代的记录中计时, 不在迭代中时不计时。"""
+        if self.metrics_record is None:
+            return nullcontext()
+        return self.metrics_record.stage(name)
+
+    def count(self, name, value=1):
+        if self.metrics_record is not None:
+            self.metrics_record.count(name, value)
+
+    def prepare(self, pt_list, time, suffix=""):
+        """生成平面布置、示意图和两段json文件。
+        :param pt_list: 边界控制点
+        :param time: 迭代次数
+        :param suffix: 文件名后缀, 用于区分同一次迭代中的多个候选布置
+        :return: 本次计算的mdb/odb名称, 第二段json的文件名
+        """
+        with self.stage("layout"):
+            plain = InitPlain(pt_list, self.root_method, previous=self.last_plain if self.incremental else None)
+        abq_name = "%s-%d%s" % (self.project_name, time, suffix)
+        if suffix:
+            # 候选布置都在上一次选中的布置的基础上生成, 见iterate_population
+            self.candidate_plains[abq_name] = plain
+        else:
+            self.last_plain = plain
+        self.count("members", len(plain.layout.x3) + len(plain.layout.y3))
+        self.count("inner_nodes", len(plain.layout.in3))
+        # plain.plot_xy()
+        if self.plot_every is not None and time % self.plot_every == 0:
+            with self.stage("plot"):
+                if self.plot_worker is not None:
+                    self.plot_worker.submit(plain, abq_name, self.json_path)
+                else:
+                    plain.save_fig(abq_name, self.json_path)
+        tmp_1st_name = "%s-1st-%d%s%s" % (self.project_name, time, suffix, self.ext)
+        tmp_2nd_name = "%s-2nd-%d%s%s" % (self.project_name, time, suffix, self.ext)
+        with self.stage("write"):
+            plain.to_json(file_name=tmp_1st_name, save_path=self.json_path)
 
-    def run(self, pt_list):
-        for time in range(self.iter_times):
-            print("time:%d" % time, "pt_list=\n", pt_list)
-            plain = InitPlain(pt_list)
-            # plain.plot_xy()
-            plain.save_fig("%s-%d" % (self.project_name, time), self.json_path)
-            res_file_prefix = "res_"
-            tmp_1st_name = "%s-1st-%d.json" % (self.project_name, time)
-            tmp_2nd_name = "%s-2nd-%d.json" % (self.project_name, time)
-            d_1st = plain.to_json(file_name=tmp_1st_name, save_path=self.json_path)
-
-            abq_name = "%s-%d" % (self.project_name, time)
+            # 直接使用layout中的数组, 只在写文件时转换
             d_2nd = GenerateAbaqusData.to_json(
-                d_in=d_1st,
+                d_in=plain.layout,
                 json_file_name=tmp_2nd_name,
-                res_file_prefix=res_file_prefix,
+                res_file_prefix=self.res_file_prefix,
                 json_save_dir=self.json_path,
                 abaqus_dir=self.abaqus_dir,
                 mdb_name=abq_name,
@@ -55,21 +266,311 @@ class Project(object):
                 density=1850,
                 deformation_step_name="Step-1",
             )
+        for name in (tmp_1st_name, tmp_2nd_name):
+            self.count("bytes_written", os.path.getsize(self.json_path + "/" + name))
+        return abq_name, tmp_2nd_name
+
+    def solve(self, tmp_2nd_name, abq_name):
+        """调用abaqus计算并读取结果。可以在线程池中并发调用。
+        :return: 结果字典
+        """
+        with self.acquire_abaqus() as abaqus_env:
+            if self.one_session:
+                status = abaqus_env.pre_solve_post(self.json_path, tmp_2nd_name)
+                if not status["ok"]:
+                    raise Exception("Abaqus fail at stage %s, job status %s:\n%s"
+                                    % (status["stage"], status["job_status"], status["error"]))
+            else:
+                for process in (abaqus_env.pre_process, abaqus_env.post_process):
+                    ret = process(self.json_path, tmp_2nd_name)
+                    if not ret.ok:
+                        raise Exception("Abaqus fail: %r, see %s" % (ret, ret.log_path))
+
+        res_file_name = self.res_file_prefix + abq_name + self.ext
+        return load_data(self.json_path + "/" + res_file_name)
+
+    def load_input(self, tmp_2nd_name):
+        return load_data(self.json_path + "/" + tmp_2nd_name)
+
+    def solve_cheap(self, tmp_2nd_name, abq_name):
+        """用cheap_solver近似计算, 结果格式与solve相同。
+        :return: 结果字典
+        """
+        if self.cheap_solver is None:
+            return LinearFrame.to_json(self.load_input(tmp_2nd_name), input_file=self.json_path + "/" + tmp_2nd_name)
+        return self.cheap_solver(self.load_input(tmp_2nd_name))
+
+    def solve_cached(self, tmp_2nd_name, abq_name):
+        """先查缓存, 没有命中时调用solve并把结果放入缓存。
+        :return: 结果字典, 是否命中缓存
+        """
+        d_in = self.load_input(tmp_2nd_name)
+        d = self.cache.get(d_in)
+        if d is not None:
+            print("cache hit:%s" % abq_name)
+            return d, True
+        d = self.solve(tmp_2nd_name, abq_name)
+        self.cache.put(d_in, d)
+        return d, False
+
+    def evaluate(self, tmp_2nd_name, abq_name, time, fidelity):
+        """按给定的精度计算, 并在history中记录本次计算。
+        :param fidelity: FIDELITY_ABAQUS或FIDELITY_CHEAP
+        :return: 结果字典
+        """
+        start = _time.time()
+        cached = False
+        with self.stage("solve_%s" % fidelity):
+            if fidelity == self.FIDELITY_CHEAP:
+                d = self.solve_cheap(tmp_2nd_name, abq_name)
+            elif self.cache is not None:
+                d, cached = self.solve_cached(tmp_2nd_name, abq_name)
+            else:
+                d = self.solve(tmp_2nd_name, abq_name)
+        self.count("cache_hits", int(cached))
+        record = {
+            "time": time,
+            "name": abq_name,
+            "fidelity": fidelity,
+            "cached": cached,
+            "bound_stderr": d['bound_stderr'],
+            "duration": _time.time() - start,
+        }
+        with self.history_lock:
+            self.history.append(record)
+        return d
+
+    def choose_fidelity(self, time, cheap_converged):
+        """第0次和每verify_every次迭代, 或者近似计算已经收敛时用abaqus计算, 其余用近似计算。
+        :param time: 迭代次数
+        :param cheap_converged: 上一次近似计算是否已经收敛
+        :return:
+        """
+        if self.verify_every is None:
+            return self.FIDELITY_ABAQUS
+        if time % self.verify_every == 0 or cheap_converged:
+            return self.FIDELITY_ABAQUS
+        return self.FIDELITY_CHEAP
+
+    def cheap_converged(self, fidelity, last_stderr, stderr):
+        """近似计算的bound_stderr相对上一次近似计算的变化小于cheap_tol时认为已经收敛。
+        :param last_stderr: 上一次近似计算的bound_stderr, abaqus校核后为None
+        :return:
+        """
+        if fidelity != self.FIDELITY_CHEAP or last_stderr is None:
+            return False
+        return abs(stderr - last_stderr) <= self.cheap_tol * abs(last_stderr)
+
+    def fidelity_summary(self):
+        """按精度统计history中的计算次数和耗时。
+        :return: {fidelity: {"count": ..., "cached": ..., "duration": ...}}
+        """
+        summary = {}
+        for record in self.history:
+            item = summary.setdefault(record["fidelity"], {"count": 0, "cached": 0, "duration": 0.0})
+            item["count"] += 1
+            item["cached"] += int(record["cached"])
+            item["duration"] += record["duration"]
+        return summary
+
+    def update_best(self, time, pt_list, d, fidelity):
+        """abaqus的结果优先于近似计算的结果, 同精度时保留bound_stderr更小的布置。
+        :return: 是否更新了best
+        """
+        rank = lambda fid: 0 if fid == self.FIDELITY_CHEAP else 1
+        best = self.best
+        if best is not None:
+            if rank(fidelity) < rank(best["fidelity"]):
+                return False
+            if rank(fidelity) == rank(best["fidelity"]) and d['bound_stderr'] >= best["bound_stderr"]:
+                return False
+        self.best = {"time": time, "pt_list": pt_list, "fidelity": fidelity, "bound_stderr": d['bound_stderr']}
+        return True
+
+    def should_stop(self, stderrs, start, fidelity):
+        if self.stop_criteria is None:
+            return False
+        self.stop_reason = self.stop_criteria.check(stderrs, _time.time() - start, fidelity)
+        if self.stop_reason is not None:
+            print("stop:", self.stop_reason)
+            return True
+        return False
+
+    def checkpoint_file(self):
+        return "%s/%s.checkpoint.json" % (self.json_path, self.project_name)
+
+    def save_checkpoint(self, state):
+        """每次迭代完成后保存迭代状态、最好的布置、计算记录和随机数状态。
+        用atomic_open写入, 中途崩溃不会留下写了一半的文件。
+        :param state: 迭代状态, 见init_state
+        :return:
+        """
+        d = dict(state)
+        d["best"] = self.best
+        d["history"] = self.history
+        d["random_state"] = getstate()
+        with atomic_open(self.checkpoint_file()) as f:
+            f.write(json.dumps(d))
+
+    def load_checkpoint(self):
+        """恢复save_checkpoint保存的状态。
+        :return: 迭代状态, 没有检查点时返回None
+        """
+        path = self.checkpoint_file()
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            d = json.load(f)
+        to_points = lambda pts: [tuple(p) for p in pts]
+        self.best = d.pop("best")
+        if self.best is not None:
+            self.best["pt_list"] = to_points(self.best["pt_list"])
+        self.history = d.pop("history")
+        version, internal, gauss_next = d.pop("random_state")
+        setstate((version, tuple(internal), gauss_next))
+        d["points"] = [to_points(pts) for pts in d["points"]]
+        if not isinstance(d["stderrs"], dict):
+            # 旧的检查点没有区分精度, 按每条history的精度重新分组
+            d["stderrs"] = {}
+            for record in self.history:
+                d["stderrs"].setdefault(record.get("fidelity", self.FIDELITY_ABAQUS), []).append(record["bound_stderr"])
+        print("resume from %s, time:%d" % (path, d["time"]))
+        return d
+
+    def init_state(self, pt_list, resume):
+        """
+        :param resume: 为True时从json_path中的检查点继续
+        :return: 迭代状态, {"time": 下一次迭代的次数, "points": 下一次迭代的布置,
+            "converged", "last_stderr", "stderrs": {fidelity: 每次迭代的bound_stderr}, "elapsed": 已用时间, "stop_reason"}
+        """
+        state = self.load_checkpoint() if resume else None
+        if state is None:
+            self.best = None
+            self.history = []
+            state = {"time": 0, "points": [pt_list], "converged": False, "last_stderr": None,
+                     "stderrs": {}, "elapsed": 0.0, "stop_reason": None}
+        self.stop_reason = state["stop_reason"]
+        return state
+
+    def finish_iteration(self, state, time, pt_list, d, fidelity, start):
+        """记录一次迭代的结果并检查停止条件。
+        :return: 是否停止迭代
+        """
+        state["converged"] = self.cheap_converged(fidelity, state["last_stderr"], d['bound_stderr'])
+        state["last_stderr"] = d['bound_stderr'] if fidelity == self.FIDELITY_CHEAP else None
+        self.update_best(time, pt_list, d, fidelity)
+        state["stderrs"].setdefault(fidelity, []).append(d['bound_stderr'])
+        state["time"] = time + 1
+        if self.should_stop(state["stderrs"], start, fidelity):
+            state["stop_reason"] = self.stop_reason
+            state["elapsed"] = _time.time() - start
+            self.save_checkpoint(state)
+            return True
+        return False
+
+    def iterate(self, pt_list, resume=False):
+        """
+        :param pt_list: 初始的边界控制点
+        :param resume: 为True时从json_path中的检查点继续, 不重复计算已经完成的迭代
+        :return: 迭代中最好的布置
+        """
+        state = self.init_state(pt_list, resume)
+        if self.population > 1:
+            return self.iterate_population(state)
+        pt_list = state["points"][0]
+        start = _time.time() - state["elapsed"]
+        times = range(state["time"], self.iter_times) if state["stop_reason"] is None else []
+        for time in times:
+            with self.iteration_metrics(time) as record:
+                print("time:%d" % time, "pt_list=\n", pt_list)
+                abq_name, tmp_2nd_name = self.prepare(pt_list, time)
+                fidelity = self.choose_fidelity(time, state["converged"])
+                d = self.evaluate(tmp_2nd_name, abq_name, time, fidelity)
+                record.set("fidelity", fidelity)
+                record.set("bound_stderr", d['bound_stderr'])
+                print("fidelity=%s" % fidelity, "bound_stderr=", d['bound_stderr'])
+                if self.finish_iteration(state, time, pt_list, d, fidelity, start):
+                    break
+
+                # factor = self.step_factor * random() + 0.05
+                factor = self.step_factor
 
-            self.abaqus_env.pre_process(self.json_path, tmp_2nd_name)
-            self.abaqus_env.post_process(self.json_path, tmp_2nd_name)
+                with record.stage("iteration"):
+                    iter = Iteration(d, factor=factor, enable_rand=self.enable_rand)
+                    pt_list = iter.get_new_points()
+                record.count("pairs", iter.n_pairs)
+                state["points"] = [pt_list]
+                state["elapsed"] = _time.time() - start
+                with record.stage("checkpoint"):
+                    self.save_checkpoint(state)
+        return self.best["pt_list"] if self.best is not None else pt_list
 
-            res_file_name = res_file_prefix + abq_name + ".json"
-            with open(self.json_path + "/" + res_file_name, "r") as f:
-                d = json.load(f)
-                print("bound_stderr=", d['bound_stderr'])
+    def pool_size(self):
+        """并发计算的候选布置数, 受CPU和licence token预算的限制。
+        :return:
+        """
+        size = self.population
+        if self.cpu_budget is not None:
+            size = min(size, self.cpu_budget // self.cpus_per_job)
+        if self.licence_budget is not None:
+            size = min(size, self.licence_budget // self.tokens_per_job)
+        return max(size, 1)
 
-            # factor = self.step_factor * random() + 0.05
-            factor = self.step_factor
+    def candidate_factors(self):
+        """每次迭代中各候选布置的步进速率, 在step_factor的0.5~1.5倍之间均匀分布。
+        :return:
+        """
+        k = self.population
+        return [self.step_factor * (0.5 + i / (k - 1.0)) for i in range(k)]
 
-            iter = Iteration(d, factor=factor, enable_rand=self.enable_rand)
-            pt_list = iter.get_new_points()
+    def iterate_population(self, state):
+        """每次迭代由上一次最好的结果生成population个候选布置, 在线程池中并发计算,
+        保留bound_stderr最小的候选。给定worker_dir时每个线程使用自己槽位的worker(见start_workers),
+        一个候选超时只会杀掉它所在槽位的worker, 这个槽位之后退回到每个脚本启动一次cae的方式。
+        :param state: 迭代状态, 见init_state
+        :return: 迭代中最好的候选布置
+        """
+        factors = self.candidate_factors()
+        candidates = state["points"]
+        pt_list = candidates[0]
+        start = _time.time() - state["elapsed"]
+        times = range(state["time"], self.iter_times) if state["stop_reason"] is None else []
+        with ThreadPoolExecutor(max_workers=self.pool_size()) as pool:
+            for time in times:
+                with self.iteration_metrics(time) as record:
+                    print("time:%d" % time, "candidates=%d" % len(candidates))
+                    record.set("candidates", len(candidates))
+                    # 绘图和写json在主线程中完成, 只把abaqus计算放到线程池中
+                    prepared = [self.prepare(pts, time, "-%d" % k) for k, pts in enumerate(candidates)]
+                    names = [abq_name for abq_name, _ in prepared]
+                    json_names = [tmp_2nd_name for _, tmp_2nd_name in prepared]
+                    # 同一次迭代中的候选布置用相同的精度计算
+                    fidelity = self.choose_fidelity(time, state["converged"])
+                    results = list(pool.map(self.evaluate, json_names, names,
+                                            [time] * len(names), [fidelity] * len(names)))
+                    best = min(range(len(results)), key=lambda k: results[k]['bound_stderr'])
+                    d = results[best]
+                    pt_list = candidates[best]
+                    self.last_plain = self.candidate_plains[names[best]]
+                    self.candidate_plains = {}
+                    record.set("fidelity", fidelity)
+                    record.set("bound_stderr", d['bound_stderr'])
+                    print("best candidate:%s" % names[best], "fidelity=%s" % fidelity,
+                          "bound_stderr=", d['bound_stderr'])
+                    if self.finish_iteration(state, time, pt_list, d, fidelity, start):
+                        break
 
+                    candidates = []
+                    with record.stage("iteration"):
+                        for factor in factors:
+                            iter = Iteration(d, factor=factor, enable_rand=self.enable_rand)
+                            candidates.append(iter.get_new_points())
+                            record.count("pairs", iter.n_pairs)
+                    state["points"] = candidates
+                    state["elapsed"] = _time.time() - start
+                    with record.stage("checkpoint"):
+                        self.save_checkpoint(state)
+        return self.best["pt_list"] if self.best is not None else pt_list
 
 if __name__ == '__main__':
     pass
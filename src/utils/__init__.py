@@ -1,4 +1,35 @@
-from .iter import *
-from .my_types import *
-from .run_abaqus import *
-from .utils import *
+# -*- coding:utf-8 -*-
+# 子模块按需导入: 第一次访问某个名字时才导入它所在的子模块,
+# 例如只用到RunAbaqus时不会导入matplotlib和scipy。
+from importlib import import_module
+
+_EXPORTS = {
+    'frame_solver': ('GRAVITY', 'POISSON_RATIO', 'HANG_POINT_Z', 'LOAD_MIDDLE_X',
+                     'LINK_STIFFNESS_FACTOR',
+                     'frame_stiffness', 'rotation', 'LinearFrame'),
+    'interchange': ('atomic_open', 'is_binary', 'load_data', 'save_data', 'save_result', 'to_list'),
+    'iter': ('avg_err', 'Distance', 'PointIndex', 'Iteration'),
+    'layout': ('DIRECTION_DTYPE', 'DIRECTION_X', 'DIRECTION_Y', 'QUANTIZE_ACCURACY', 'Layout', 'quantize'),
+    'metrics': ('Metrics', 'MetricsRecord'),
+    'my_types': ('Point2', 'Point3', 'OdbArr', 'Point', 'IterRawResult'),
+    'result_cache': ('CACHE_PARAM_KEYS', 'ResultCache'),
+    'run_abaqus': ('ScriptResult', 'RunAbaqus'),
+    'utils': ('DEBUG', 'Common', 'GenerateCoord', 'GenerateAbaqusData', 'InitPlain', 'PlotWorker'),
+}
+_MODULE_OF = dict((name, module) for module, names in _EXPORTS.items() for name in names)
+
+__all__ = sorted(_MODULE_OF)
+
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(import_module("." + module, __name__), name)
+    # 缓存到包的命名空间中, 之后的访问不再经过__getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
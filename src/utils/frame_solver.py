@@ -0,0 +1,283 @@
+# -*- coding:utf-8 -*-
+
+from itertools import chain
+from math import pi
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import spsolve
+
+from .interchange import is_binary, save_result
+
+GRAVITY = 9.8
+POISSON_RATIO = 0.28
+# 起吊参考点的高度, 与pre.py中的hang_height一致
+HANG_POINT_Z = 5.0
+# 对称轴上约束u1的节点的x坐标, 与pre.py中的Set-loadMiddle一致
+LOAD_MIDDLE_X = 24.0
+# 连接起吊参考点和杆件的LINK MPC用刚度很大的二力杆近似, 取杆件轴向刚度的倍数
+LINK_STIFFNESS_FACTOR = 1e3
+
+
+def frame_stiffness(E, G, A, I, J, L):
+    """局部坐标系下空间梁单元的刚度矩阵, 自由度顺序为(u, v, w, θx, θy, θz) x 2。
+    :param L: 单元长度的数组, 长度为n
+    :return: (n, 12, 12)的数组
+    """
+    L = np.asarray(L, dtype=float)
+    k = np.zeros((len(L), 12, 12))
+    ea, gj = E * A / L, G * J / L
+    b12, b6, b4, b2 = 12 * E * I / L ** 3, 6 * E * I / L ** 2, 4 * E * I / L, 2 * E * I / L
+    entries = [
+        # 轴向和扭转
+        (0, 0, ea), (0, 6, -ea), (6, 6, ea),
+        (3, 3, gj), (3, 9, -gj), (9, 9, gj),
+        # 绕局部z轴弯曲(v, θz)
+        (1, 1, b12), (1, 5, b6), (1, 7, -b12), (1, 11, b6),
+        (5, 5, b4), (5, 7, -b6), (5, 11, b2),
+        (7, 7, b12), (7, 11, -b6), (11, 11, b4),
+        # 绕局部y轴弯曲(w, θy)
+        (2, 2, b12), (2, 4, -b6), (2, 8, -b12), (2, 10, -b6),
+        (4, 4, b4), (4, 8, b6), (4, 10, b2),
+        (8, 8, b12), (8, 10, b6), (10, 10, b4),
+    ]
+    for i, j, val in entries:
+        k[:, i, j] = val
+        k[:, j, i] = val
+    return k
+
+
+def rotation(direction):
+    """平面内沿direction的杆件的局部坐标轴(行向量), 局部z轴为整体z轴。
+    :param direction: 单位向量的数组, (n, 3)
+    :return: (n, 3, 3)
+    """
+    ez = np.zeros_like(direction)
+    ez[:, 2] = 1.0
+    ey = np.cross(ez, direction)
+    return np.stack((direction, ey, ez), axis=1)
+
+
+class LinearFrame(object):
+    """
+    不依赖abaqus的线性空间刚架模型, 用于快速粗略地评估一个平面布置。
+    输入GenerateAbaqusData.to_json生成的字典, 输出与post.py相同格式的结果:
+    bound_pts/inner_pts为[x, y, z, x', y', z']的列表, bound_stderr为边界点z'的标准差。
+
+    与pre.py中的abaqus模型对应:
+    - X向杆件(Part A)和Y向杆件(Part B)在内部点处耦合u1, u2, u3, ur1, ur2, 放开ur3;
+    - 圆管截面由radius, thickness给出, 材料为elastic_modular, density, 泊松比0.28;
+    - 起吊参考点位于(left_hang, 0, 5)和(right_hang, 0, 5), 与相邻的4个Part B节点用刚性二力杆连接,
+      参考点的u2=0, u3为起吊高度;
+    - 对称轴上Part B节点的u2=0, 对称轴上x=24(Set-loadMiddle)的节点u1=0, 没有这个节点时取最近的节点。
+
+    已知的局限: 与abaqus不同, 这里是小变形线性分析, 没有几何非线性。
+    杆件细长、挠度远大于杆件尺寸时结果与abaqus相差很大, 例如test中40跨的布置,
+    bound_stderr为5.3, 边界点z'在-16.6到-2.6之间(起吊高度为5), 只能用来比较布置的相对好坏,
+    不能代替abaqus的结果, 所以Project中要定期用abaqus校核。
+    """
+
+    def __init__(self, d_in, accuracy=1e-6):
+        self.d_in = d_in
+        self.accuracy = accuracy
+
+        r, t = d_in['radius'], d_in['thickness']
+        r_in = r - t
+        self.E = d_in['elastic_modular']
+        self.G = self.E / (2 * (1 + POISSON_RATIO))
+        self.A = pi * (r ** 2 - r_in ** 2)
+        self.I = pi / 4 * (r ** 4 - r_in ** 4)
+        self.J = 2 * self.I
+        self.weight = d_in['density'] * self.A * GRAVITY
+
+        self.coords = []  # 每个节点的坐标
+        self.dofs = []  # 每个节点的6个自由度编号
+        self.n_dof = 0
+        self.nodes = {'A': dict(), 'B': dict()}  # 量化后的坐标 -> 节点编号
+        self.elements = []  # (节点1, 节点2)
+        self.build()
+
+    def key(self, pt):
+        return int(round(pt[0] / self.accuracy)), int(round(pt[1] / self.accuracy))
+
+    def new_dofs(self, n):
+        out = list(range(self.n_dof, self.n_dof + n))
+        self.n_dof += n
+        return out
+
+    def add_node(self, part, pt, inner_keys):
+        k = self.key(pt)
+        if k in self.nodes[part]:
+            return self.nodes[part][k]
+        other = self.nodes['B' if part == 'A' else 'A']
+        if k in inner_keys and k in other:
+            # 内部点耦合: 共用平动和面外转动自由度, 绕z轴的转动各自独立
+            dofs = self.dofs[other[k]][:5] + self.new_dofs(1)
+        else:
+            dofs = self.new_dofs(6)
+        self.coords.append((float(pt[0]), float(pt[1]), 0.0))
+        self.dofs.append(dofs)
+        self.nodes[part][k] = len(self.coords) - 1
+        return self.nodes[part][k]
+
+    def add_members(self, part, members, incoord, inner_keys, axis):
+        """把杆件在端点和内部点处分割成单元。
+        :param axis: 杆件方向, 0为沿x轴(Part B), 1为沿y轴(Part A)
+        """
+        fixed = 1 - axis
+        # 内部点按杆件的固定坐标分组
+        by_line = dict()
+        for pt in incoord:
+            by_line.setdefault(int(round(pt[fixed] / self.accuracy)), []).append(pt)
+        for p1, p2 in members:
+            lo, hi = sorted((p1, p2), key=lambda p: p[axis])
+            pts = [lo] + [p for p in by_line.get(int(round(lo[fixed] / self.accuracy)), [])
+                          if lo[axis] < p[axis] < hi[axis]] + [hi]
+            pts.sort(key=lambda p: p[axis])
+            ids = [self.add_node(part, p, inner_keys) for p in pts]
+            self.elements.extend((i, j) for i, j in zip(ids, ids[1:]) if i != j)
+
+    def build(self):
+        d = self.d_in
+        incoord = d['incoord']
+        inner_keys = set(self.key(p) for p in incoord)
+        self.add_members('A', d['xcoord'], incoord, inner_keys, axis=1)
+        self.add_members('B', d['ycoord'], incoord, inner_keys, axis=0)
+
+        # 起吊参考点只有平动自由度, 与相邻节点用二力杆连接
+        self.links = []
+        self.hang_dofs = []
+        for hang, height in ((d['left_hang'], d['left_hang_height']), (d['right_hang'], d['right_hang_height'])):
+            rp = self.new_dofs(3)
+            self.hang_dofs.append((rp, height))
+            rp_coord = (hang, 0.0, HANG_POINT_Z)
+            for dx, dy in ((0.0, -2.0), (0.0, 2.0), (-2.0, 0.0), (2.0, 0.0)):
+                node = self.find_node('B', (hang + dx, dy), 0.1)
+                if node is not None:
+                    self.links.append((rp, rp_coord, node))
+
+    def find_node(self, part, pt, tol):
+        candidates = [i for i in self.nodes[part].values()
+                      if abs(self.coords[i][0] - pt[0]) <= tol and abs(self.coords[i][1] - pt[1]) <= tol]
+        return min(candidates, key=lambda i: abs(self.coords[i][0] - pt[0]) + abs(self.coords[i][1] - pt[1]),
+                   default=None)
+
+    def assemble(self):
+        """组装整体刚度矩阵和重力荷载向量。
+        :return: (K, F)
+        """
+        coords = np.array(self.coords)
+        dofs = np.array(self.dofs)
+        elements = np.array(self.elements)
+        vec = coords[elements[:, 1]] - coords[elements[:, 0]]
+        L = np.linalg.norm(vec, axis=1)
+        R = rotation(vec / L[:, np.newaxis])
+        T = np.zeros((len(L), 12, 12))
+        for i in range(4):
+            T[:, 3 * i:3 * i + 3, 3 * i:3 * i + 3] = R
+        k_local = frame_stiffness(self.E, self.G, self.A, self.I, self.J, L)
+        k_global = np.matmul(np.matmul(T.transpose(0, 2, 1), k_local), T)
+
+        # 均布自重的等效节点荷载, 局部z轴向下
+        q = -self.weight
+        f_local = np.zeros((len(L), 12))
+        f_local[:, 2] = f_local[:, 8] = q * L / 2
+        f_local[:, 4] = -q * L ** 2 / 12
+        f_local[:, 10] = q * L ** 2 / 12
+        f_global = np.einsum('nji,nj->ni', T, f_local)
+
+        edofs = np.hstack((dofs[elements[:, 0]], dofs[elements[:, 1]]))
+        rows = np.repeat(edofs, 12, axis=1).ravel()
+        cols = np.tile(edofs, (1, 12)).ravel()
+        vals = [k_global.ravel()]
+        rows, cols = [rows], [cols]
+
+        # 起吊二力杆
+        k_link = LINK_STIFFNESS_FACTOR * self.E * self.A
+        for rp, rp_coord, node in self.links:
+            n = coords[node] - np.array(rp_coord)
+            length = np.linalg.norm(n)
+            n = n / length
+            k = k_link / length * np.outer(n, n)
+            link_dofs = np.array(rp + self.dofs[node][:3])
+            k = np.block([[k, -k], [-k, k]])
+            rows.append(np.repeat(link_dofs, 6))
+            cols.append(np.tile(link_dofs, 6))
+            vals.append(k.ravel())
+
+        K = coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                       shape=(self.n_dof, self.n_dof)).tocsr()
+        F = np.bincount(edofs.ravel(), weights=f_global.ravel(), minlength=self.n_dof)
+        return K, F
+
+    def boundary_conditions(self):
+        """:return: 给定位移的自由度编号和位移值"""
+        fixed = dict()
+        axis_nodes = [i for i in self.nodes['B'].values() if abs(self.coords[i][1]) < 0.1]
+        for i in axis_nodes:
+            fixed[self.dofs[i][1]] = 0.0
+        node = min(axis_nodes, key=lambda i: abs(self.coords[i][0] - LOAD_MIDDLE_X))
+        fixed[self.dofs[node][0]] = 0.0
+        for rp, height in self.hang_dofs:
+            fixed[rp[1]] = 0.0
+            fixed[rp[2]] = height
+        return np.array(list(fixed.keys())), np.array(list(fixed.values()))
+
+    def displacement(self):
+        """:return: 所有自由度的位移"""
+        K, F = self.assemble()
+        fixed, values = self.boundary_conditions()
+        free = np.ones(self.n_dof, bool)
+        free[fixed] = False
+        u = np.zeros(self.n_dof)
+        u[fixed] = values
+        rhs = F[free] - K[free][:, fixed].dot(values)
+        u[free] = spsolve(K[free][:, free].tocsc(), rhs)
+        return u
+
+    def solve(self):
+        """求解并输出与post.py相同格式的结果字典。
+        :return:
+        """
+        u = self.displacement()
+        coords = np.array(self.coords)
+        translation = u[np.array(self.dofs)[:, :3]]
+        rows = np.hstack((coords, coords + translation))
+
+        def lookup(pt):
+            k = self.key(pt)
+            node = self.nodes['A'].get(k, self.nodes['B'].get(k))
+            return None if node is None else rows[node].tolist()
+
+        bound_keys = set()
+        bound_pts = []
+        for pt in chain(self.d_in['xcoord_3d'], self.d_in['ycoord_3d']):
+            k = self.key(pt)
+            row = lookup(pt)
+            if k not in bound_keys and row is not None:
+                bound_keys.add(k)
+                bound_pts.append(row)
+        inner_pts = []
+        for pt in self.d_in['incoord_3d']:
+            row = lookup(pt)
+            if pt[0] % 1.0 == 0 and pt[1] % 1.0 == 0 and self.key(pt) not in bound_keys and row is not None:
+                inner_pts.append(row)
+
+        d = self.d_in.copy()
+        d['bound_pts'] = bound_pts
+        d['inner_pts'] = inner_pts
+        d['bound_stderr'] = float(np.std([p[5] for p in bound_pts]))
+        return d
+
+    @classmethod
+    def to_json(cls, d_in, input_file=None):
+        """求解并像post.py一样把结果写到json_save_dir/res_file_prefix + odb_name, 扩展名与input_file相同。
+        :param d_in: GenerateAbaqusData.to_json生成的字典
+        :param input_file: d_in所在的文件, 为npz时结果也保存为npz, 只保存新增的字段和对input_file的引用
+        :return: 结果字典
+        """
+        d = cls(d_in).solve()
+        ext = ".npz" if input_file is not None and is_binary(input_file) else ".json"
+        result_file = d['json_save_dir'] + "/" + d['res_file_prefix'] + str(d['odb_name']) + ext
+        save_result(result_file, d_in, d, input_file)
+        return d
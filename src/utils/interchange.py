@@ -0,0 +1,4 @@
+# -*- coding:utf-8 -*-
+# 与abaqus_api中的脚本共用同一种布置和结果文件的读写, 见abaqus_api/interchange.py
+
+from abaqus_api.interchange import atomic_open, is_binary, load_data, save_data, save_result, to_list
@@ -1,16 +1,15 @@
 # coding=utf-8
 import json
-from math import sqrt
+from math import sqrt, floor, ceil
 from operator import itemgetter
-from random import random
+from random import Random, getrandbits, random
 from random import shuffle
 
-import matplotlib.pyplot as plt
+import numpy as np
 from numpy import std
-from scipy.interpolate import UnivariateSpline
 
+from src.utils.interchange import load_data
 from src.utils.my_types import Point, Point2, OdbArr, IterRawResult
-from src.utils.utils import InitPlain
 
 
 def avg_err(points: list) -> (float, float):
@@ -69,6 +68,52 @@ class Distance(object):
             return sqrt(x_2 + y_2 + z_2)
 
 
+class PointIndex(object):
+    """
+    平面网格哈希索引。按(x, y)把点分到边长为cell_size的网格中,
+    近邻查询只需检查相邻的网格, 不必遍历所有点。
+    """
+
+    def __init__(self, pts, cell_size=1.0):
+        self.pts = []
+        self.cell_size = cell_size
+        self.buckets = dict()
+        for p in pts:
+            self.add(p)
+
+    def add(self, p: Point):
+        self.buckets.setdefault(self.cell(p), []).append(len(self.pts))
+        self.pts.append(p)
+
+    def cell(self, p: Point) -> (int, int):
+        return floor(p[0] / self.cell_size), floor(p[1] / self.cell_size)
+
+    def candidates(self, p: Point, radius: float = 1.0) -> list:
+        """返回x, y方向上与p相差都不超过radius的网格中的点, 保持点在原列表中的顺序。
+        :param p:
+        :param radius:
+        :return:
+        """
+        n = int(ceil(radius / self.cell_size))
+        cx, cy = self.cell(p)
+        idx = []
+        for i in range(cx - n, cx + n + 1):
+            for j in range(cy - n, cy + n + 1):
+                idx.extend(self.buckets.get((i, j), ()))
+        idx.sort()
+        return [self.pts[i] for i in idx]
+
+    def on_axis(self) -> list:
+        """返回对称轴(y=0.0)上的点, 按x排序。
+        :return:
+        """
+        idx = []
+        for (i, j), bucket in self.buckets.items():
+            if j == 0:
+                idx.extend(k for k in bucket if self.pts[k][1] == 0.0)
+        return sorted((self.pts[k] for k in idx), key=itemgetter(0))
+
+
 class Iteration(object):
     """
     思路：
@@ -85,13 +130,14 @@ class Iteration(object):
         :return: 点对(pt_pair)的列表
         """
         pairs = []
+        index = PointIndex(pts_in)
         for p_b in pts_b:
-            for p_in in pts_in:
+            for p_in in index.candidates(p_b, 1.0):
                 p1, p2 = p_b[:3], p_in[:3]
                 if Distance.abs(p1, p2) <= 1.0:
                     pairs.append((p_b, p_in))
         if not cls.contains_sym_pt_pair(pairs):
-            pairs.extend(cls.get_sym_pt_pair(pts_b, pts_in))
+            pairs.extend(cls.get_sym_pt_pair(pts_b, pts_in, index))
         return pairs
 
     @classmethod
@@ -104,11 +150,18 @@ class Iteration(object):
         return sym_pt_in_pairs
 
     @classmethod
-    def get_sym_pt_pair(cls, pts_b, pts_in):
+    def get_sym_pt_pair(cls, pts_b, pts_in, index=None):
+        """取对称轴上最左和最右的边界点, 分别与对称轴上最左和最右的内部点组成点对。
+        :param pts_b:
+        :param pts_in:
+        :param index: pts_in的PointIndex, 为None时新建
+        :return:
+        """
+        if index is None:
+            index = PointIndex(pts_in)
         sym_b = [p for p in pts_b if p[1] == 0.0]
-        sym_in = [p for p in pts_in if p[1] == 0.0]
         sym_b.sort(key=itemgetter(0))
-        sym_in.sort(key=itemgetter(0))
+        sym_in = index.on_axis()
         pair_lb = (sym_b[0], sym_in[0])
         pair_rb = (sym_b[-1], sym_in[-1])
         return [pair_lb, pair_rb]
@@ -186,12 +239,13 @@ class Iteration(object):
 
     @classmethod
     def adjust_by_z(cls, p_b: OdbArr, p_in: OdbArr, avg_z: float, factor: float = 1.0,
-                    enable_rand: bool = False) -> Point2:
+                    enable_rand: bool = False, rand_value: float = None) -> Point2:
         """计算avg和当前点z坐标的高差，然后以此高差结合p_b和p_in的关系计算新的p_b所在位置。
         :param p_b:
         :param p_in:
         :param avg_z:
         :param factor:
+        :param rand_value: enable_rand时使用的[0, 1)随机数, 为None时调用random()
         :return:
         """
         assert factor > 0, "步进速率必须>0"
@@ -200,10 +254,11 @@ class Iteration(object):
 
         adj_val = diff_h * factor
         if enable_rand:
+            u = random() if rand_value is None else rand_value
             if adj_val == 0:
-                adj_val = (random() - 0.5) * 0.004  # [-0.002, 0.002)
+                adj_val = (u - 0.5) * 0.004  # [-0.002, 0.002)
             else:
-                rand_factor = 1 + (random() - 0.5) * 0.002  # [0.999, 1.001)
+                rand_factor = 1 + (u - 0.5) * 0.002  # [0.999, 1.001)
                 adj_val = adj_val * rand_factor
 
         if relation == 'x':
@@ -222,6 +277,41 @@ class Iteration(object):
             out = (p_b[0], new_y)
         return out
 
+    @classmethod
+    def adjust_by_z_batch(cls, pts_b, pts_in, avg_z: float, factor: float = 1.0, rng=None, accuracy=0.0001):
+        """adjust_by_z的向量化版本, 一次计算所有点对。
+        :param pts_b: 边界点, (P, 6)的数组
+        :param pts_in: 与之配对的内部点, (P, 6)的数组
+        :param avg_z:
+        :param factor:
+        :param rng: numpy.random.Generator, 不为None时与enable_rand一样对调整量加扰动
+        :param accuracy: 判断点对关系的精度, 与relation相同
+        :return: 新的平面坐标, (P, 2)的数组
+        """
+        assert factor > 0, "步进速率必须>0"
+        b = np.asarray(pts_b, dtype=np.float64).reshape(-1, 6)
+        p_in = np.asarray(pts_in, dtype=np.float64).reshape(-1, 6)
+        along_y = np.abs(b[:, 0] - p_in[:, 0]) < accuracy
+        along_x = ~along_y & (np.abs(b[:, 1] - p_in[:, 1]) < accuracy)
+        wrong = ~(along_x | along_y)
+        if wrong.any():
+            i = int(np.argmax(wrong))
+            raise Exception("错误的点对!" + "p_b=%s, p_in=%s" % (pts_b[i], pts_in[i]))
+
+        adj_val = (b[:, 5] - avg_z) * factor
+        if rng is not None:
+            u = rng.random(len(b))
+            adj_val = np.where(adj_val == 0, (u - 0.5) * 0.004, adj_val * (1 + (u - 0.5) * 0.002))
+
+        out = b[:, :2].copy()
+        new_x = np.where(b[:, 0] < p_in[:, 0], b[:, 0] - adj_val, b[:, 0] + adj_val)
+        # 对称轴两侧的点不能越过对称轴, 至少保留0.05的距离
+        new_y = np.where(b[:, 1] < p_in[:, 1], np.minimum(b[:, 1] - adj_val, -0.05),
+                         np.maximum(b[:, 1] + adj_val, 0.05))
+        out[along_x, 0] = new_x[along_x]
+        out[along_y, 1] = new_y[along_y]
+        return out
+
     @classmethod
     def filter_start_from_zero(cls, pt_list: list):
         """调整生成的列表，如果有非对称轴的点的坐标越过了对称轴的x值，必须忽略掉。
@@ -242,6 +332,7 @@ class Iteration(object):
         :param pt_list:
         :return:
         """
+        from scipy.interpolate import UnivariateSpline
         new_pts = []
         # 只取大于等于零的点
         pt_list = [p for p in pt_list if p[1] >= 0]
@@ -261,43 +352,67 @@ class Iteration(object):
                 new_pts.append(p)
         return new_pts
 
-    def reduce_pts(self):
-        """生成的点太多会带来一些问题，尝试减少一些点
+    def reduce_pts(self, seed=None):
+        """生成的点太多会带来一些问题，尝试减少一些点。
+        已保留的点按1.0的网格分桶, 每个点只和相邻网格中已保留的点比较距离。
+        :param seed: 打乱顺序用的随机种子, 为None时使用全局的random
         :return:
         """
         pts = [p for p in self.raw_points_dict.values() if p[1] >= 0.0]
         pts = self.filter_start_from_zero(pts)
-        shuffle(pts)
+        if seed is None:
+            shuffle(pts)
+        else:
+            Random(seed).shuffle(pts)
         result = []
+        index = PointIndex([])
         for p1 in pts:
             valid = True
             if p1[1] == 0.0:
                 result.append(p1)
+                index.add(p1)
                 continue
-            for p2 in result:
+            for p2 in index.candidates(p1, 1.0):
                 dis = Distance.euclidean(p1, p2)
                 if dis <= 1.0:
                     valid = False
                     break
             if valid:
                 result.append(p1)
+                index.add(p1)
         print("before reduce: %d" % len(pts), "after: %d" % len(result))
         result.sort(key=itemgetter(0))
         return result
 
 
+    def jitter_rng(self):
+        """enable_rand时的随机数生成器。没有给出seed时从全局的random取种子,
+        这样保存和恢复全局random的状态就能复现迭代。
+        :return: numpy.random.Generator或None
+        """
+        if not self.enable_rand:
+            return None
+        seed = self.seed if self.seed is not None else getrandbits(64)
+        return np.random.default_rng(seed)
+
     def __solve(self) -> IterRawResult:
         pairs = self.get_b_in_pairs(self.bound_pts, self.inner_pts)
-        raw_points_dict = dict()
-        for p_b, p_in in pairs:
-            p_new = self.adjust_by_z(p_b, p_in, self.avg_z, factor=self.factor, enable_rand=self.enable_rand)
-            raw_points_dict[tuple(p_b)] = p_new
+        # 边界点和内部点的点对数
+        self.n_pairs = len(pairs)
+        if not pairs:
+            return dict()
+        pts_b = [p_b for p_b, _ in pairs]
+        new_pts = self.adjust_by_z_batch(pts_b, [p_in for _, p_in in pairs], self.avg_z, factor=self.factor,
+                                         rng=self.jitter_rng())
+        # 同一个边界点有多个点对时保留最后一个, 与逐个调用adjust_by_z一致
+        raw_points_dict = dict(zip((tuple(p_b) for p_b in pts_b), (tuple(p) for p in new_pts.tolist())))
         return raw_points_dict
 
     def plot_raw_result(self):
         """
         :return:
         """
+        import matplotlib.pyplot as plt
         fig = plt.figure(figsize=(15, 8))
         for pt_old, pt_new in self.raw_points_dict.items():
             # xx = [pt_old[0], pt_new[0]]
@@ -311,6 +426,7 @@ class Iteration(object):
         """
         :return:
         """
+        import matplotlib.pyplot as plt
         for p in self.new_points:
             plt.plot(p[0], p[1], 'ro')
         plt.show()
@@ -319,21 +435,31 @@ class Iteration(object):
         return self.new_points
 
     def generate_new_plain(self):
+        from src.utils.utils import InitPlain
         new_plain = InitPlain(self.new_points)
         return new_plain
 
-    def __init__(self, d_in, factor, enable_rand=False):
+    def __init__(self, d_in, factor, enable_rand=False, seed=None):
         self.factor = factor
         self.enable_rand = enable_rand
+        self.seed = seed
         self.bound_pts = sorted(d_in['bound_pts'], key=itemgetter(0))
         self.inner_pts = sorted(d_in['inner_pts'], key=itemgetter(0))
         self.avg_z, self.stderr = avg_err(self.bound_pts)
         self.raw_points_dict = self.__solve()
 
-        tmp = self.reduce_pts()
+        tmp = self.reduce_pts(self.seed)
         self.new_points = tmp[:]
         # self.new_points = self.smooth(tmp)
 
+    @classmethod
+    def from_file(cls, path, factor, enable_rand=False, seed=None):
+        """由post.py的结果文件(json或npz)生成Iteration。
+        :param path: 结果文件
+        :return:
+        """
+        return cls(load_data(path), factor=factor, enable_rand=enable_rand, seed=seed)
+
 
 if __name__ == '__main__':
     data_path = "E:/Abaqusdir/auto/output"
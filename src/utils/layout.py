@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+# 杆件方向
+DIRECTION_DTYPE = np.dtype(np.int8)
+DIRECTION_X = 0  # X向杆件(xcoord), 沿y轴布置
+DIRECTION_Y = 1  # Y向杆件(ycoord), 沿x轴布置
+# 坐标的量化精度, 去重、索引和缓存键都按它量化
+QUANTIZE_ACCURACY = 1e-6
+
+
+def quantize(pt, accuracy=QUANTIZE_ACCURACY):
+    """把坐标按精度量化成整数元组, 用作去重和索引的键, 避免直接比较浮点数。
+    :param pt: 坐标或坐标值
+    :param accuracy: 量化精度
+    :return: 整数或整数元组
+    """
+    if isinstance(pt, (tuple, list)):
+        return tuple(int(round(v / accuracy)) for v in pt)
+    return int(round(pt / accuracy))
+
+
+class Layout(object):
+    """
+    用numpy数组保存的平面布置。
+    杆件和内部点按z=0的三维坐标各存一块内存:
+    xcoord/ycoord为(N, 2, 2)的杆件端点, incoord为(M, 2)的内部点,
+    xcoord_3d/ycoord_3d/incoord_3d为(K, 3)的三维点, 都是同一块内存的视图, 不再复制。
+    只有to_dict时才转换成json用的列表。
+    """
+
+    def __init__(self, xcoord, ycoord, incoord, left_bound, right_bound):
+        self.x3 = self.lift(xcoord, (2,))
+        self.y3 = self.lift(ycoord, (2,))
+        self.in3 = self.lift(incoord, ())
+        self.left_bound = left_bound
+        self.right_bound = right_bound
+
+    @classmethod
+    def lift(cls, coords, inner_shape):
+        """把二维坐标复制到z=0的三维坐标数组中, 这是布置中唯一的一次复制。
+        :param coords: 坐标列表或数组, 形状为(n,) + inner_shape + (2,)
+        :param inner_shape: 每个元素的形状, 杆件为(2,), 点为()
+        :return: (n,) + inner_shape + (3,)的数组
+        """
+        arr = np.asarray(coords, dtype=np.float64).reshape((-1,) + inner_shape + (2,))
+        out = np.zeros(arr.shape[:-1] + (3,))
+        out[..., :2] = arr
+        return out
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['xcoord'], d['ycoord'], d['incoord'], d.get('left_bound'), d.get('right_bound'))
+
+    @property
+    def xcoord(self):
+        return self.x3[..., :2]
+
+    @property
+    def ycoord(self):
+        return self.y3[..., :2]
+
+    @property
+    def incoord(self):
+        return self.in3[:, :2]
+
+    @property
+    def xcoord_3d(self):
+        return self.x3.reshape(-1, 3)
+
+    @property
+    def ycoord_3d(self):
+        return self.y3.reshape(-1, 3)
+
+    @property
+    def incoord_3d(self):
+        return self.in3
+
+    @property
+    def nbytes(self):
+        return self.x3.nbytes + self.y3.nbytes + self.in3.nbytes
+
+    def members(self):
+        """所有杆件及其方向。
+        :return: (N, 2, 2)的端点数组, 长度为N的DIRECTION_DTYPE方向数组
+        """
+        coords = np.concatenate((self.xcoord, self.ycoord))
+        directions = np.empty(len(coords), dtype=DIRECTION_DTYPE)
+        directions[:len(self.x3)] = DIRECTION_X
+        directions[len(self.x3):] = DIRECTION_Y
+        return coords, directions
+
+    def to_dict(self):
+        """转换成InitPlain.to_json的字典, 坐标为列表。"""
+        return {
+            'xcoord': self.xcoord.tolist(),
+            'ycoord': self.ycoord.tolist(),
+            'incoord': self.incoord.tolist(),
+            'left_bound': self.left_bound,
+            'right_bound': self.right_bound,
+        }
@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+
+import json
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from .interchange import to_list
+
+
+class Metrics(object):
+    """
+    迭代过程中的分阶段耗时和计数。
+    每条记录是一个字典, 追加到path指向的jsonl文件中的一行, 同时交给sink(如果给出)。
+    path和sink都为None时不记录。可以在多个线程中同时写。
+    """
+
+    def __init__(self, path=None, sink=None):
+        """
+        :param path: jsonl文件
+        :param sink: 可调用对象, 每条记录调用一次sink(record)
+        """
+        self.path = path
+        self.sink = sink
+        self.lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None or self.sink is not None
+
+    def record(self, event, **fields):
+        """开始一条新记录, 用MetricsRecord.emit写出。
+        :param event: 记录的类型, 如"iteration"
+        :return: MetricsRecord
+        """
+        return MetricsRecord(self, event, **fields)
+
+    def write(self, record):
+        """
+        :param record: 字典, 加上timestamp后写出
+        :return:
+        """
+        if not self.enabled:
+            return
+        record = dict(record)
+        record.setdefault("timestamp", time.time())
+        with self.lock:
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=to_list) + "\n")
+        if self.sink is not None:
+            try:
+                self.sink(record)
+            except Exception as e:
+                print("Fail to send metrics:", e)
+
+
+class MetricsRecord(object):
+    """
+    一条记录, 累计各阶段的耗时(stages, 秒)和计数(counters), 其余字段原样写出。
+    同一阶段多次计时(如多个候选布置)时耗时相加。
+    """
+
+    def __init__(self, metrics, event, **fields):
+        self.metrics = metrics
+        self.fields = dict(fields)
+        self.fields["event"] = event
+        self.stages = dict()
+        self.counters = dict()
+        self.lock = Lock()
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self.lock:
+            self.fields[name] = value
+
+    def as_dict(self):
+        with self.lock:
+            d = dict(self.fields)
+            d["stages"] = dict(self.stages)
+            d["counters"] = dict(self.counters)
+        d["wall_time"] = time.perf_counter() - self.start
+        return d
+
+    def emit(self):
+        self.metrics.write(self.as_dict())
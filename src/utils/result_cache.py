@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+import json
+import os
+from threading import Lock
+
+from .interchange import atomic_open
+from .layout import QUANTIZE_ACCURACY, quantize
+
+# 参与缓存键计算的材料和起吊参数, 与GenerateAbaqusData.to_json中的字段一致
+CACHE_PARAM_KEYS = (
+    'left_hang', 'left_hang_height', 'right_hang', 'right_hang_height', 'vector',
+    'radius', 'thickness', 'elastic_modular', 'density', 'deformation_step_name',
+)
+
+
+class ResultCache(object):
+    """
+    按平面布置内容寻址的计算结果缓存。
+    键为量化后的xcoord/ycoord/incoord和材料、起吊参数的sha1, 每个键一个json文件,
+    只保存结果中输入字典没有的字段(bound_pts, inner_pts, bound_stderr等)。
+    条目数超过max_entries时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir, max_entries=1000, accuracy=QUANTIZE_ACCURACY):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.accuracy = accuracy
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    @classmethod
+    def quantize(cls, v, accuracy):
+        """把嵌套的坐标列表按精度量化成整数元组, 每个坐标与GenerateCoord.quantize的量化相同。"""
+        if isinstance(v, (tuple, list)) and v and isinstance(v[0], (tuple, list)):
+            return tuple(cls.quantize(item, accuracy) for item in v)
+        return quantize(v, accuracy)
+
+    @classmethod
+    def key(cls, d_in, accuracy=QUANTIZE_ACCURACY):
+        """与杆件的顺序和端点的顺序无关的缓存键。
+        :param d_in: GenerateAbaqusData.to_json生成的字典
+        :return: 十六进制字符串
+        """
+        members = lambda coord: sorted(tuple(sorted(pair)) for pair in cls.quantize(coord, accuracy))
+        canonical = {
+            'xcoord': members(d_in['xcoord']),
+            'ycoord': members(d_in['ycoord']),
+            'incoord': sorted(cls.quantize(d_in['incoord'], accuracy)),
+            'params': [[k, d_in.get(k)] for k in CACHE_PARAM_KEYS],
+        }
+        return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def entries(self):
+        return [name for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+
+    def __len__(self):
+        return len(self.entries())
+
+    def get(self, d_in):
+        """
+        :param d_in: GenerateAbaqusData.to_json生成的字典
+        :return: 命中时返回d_in加上缓存的结果字段, 否则返回None
+        """
+        path = self.path(self.key(d_in, self.accuracy))
+        with self.lock:
+            try:
+                with open(path, "r") as f:
+                    payload = json.load(f)
+            except (IOError, ValueError):
+                self.misses += 1
+                return None
+            self.hits += 1
+            # 更新使用时间, 淘汰时按它排序
+            os.utime(path, None)
+        d = dict(d_in)
+        d.update(payload)
+        return d
+
+    def put(self, d_in, d):
+        """缓存结果中d_in没有的字段, 然后按需淘汰。
+        :param d_in: 输入字典
+        :param d: 结果字典
+        :return: 缓存键
+        """
+        key = self.key(d_in, self.accuracy)
+        payload = dict((k, v) for k, v in d.items() if k not in d_in)
+        path = self.path(key)
+        with self.lock:
+            with atomic_open(path) as f:
+                f.write(json.dumps(payload))
+            self.evict()
+        return key
+
+    def evict(self):
+        names = self.entries()
+        if len(names) <= self.max_entries:
+            return
+        paths = sorted((os.path.join(self.cache_dir, name) for name in names), key=os.path.getmtime)
+        for path in paths[:len(names) - self.max_entries]:
+            os.remove(path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
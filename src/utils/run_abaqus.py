@@ -1,9 +1,15 @@
 # coding=utf-8
 from __future__ import print_function
-import subprocess
-from subprocess import PIPE
-import os
+import asyncio
 import glob
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+from subprocess import DEVNULL, PIPE, STDOUT
+from uuid import uuid4
 
 # TODO: 自动locate abaqus前处理器的路径
 # TODO: 搞明白abaqus目前重定向到abq.exe的机制
@@ -13,63 +19,361 @@ import glob
 """
 
 
+class ScriptResult(object):
+    """
+    一次脚本执行的结果。
+    exit_code为None表示进程没有启动或者被强制结束。
+    """
+
+    def __init__(self, script, exit_code, duration, log_path, timed_out=False):
+        self.script = script
+        self.exit_code = exit_code
+        self.duration = duration
+        self.log_path = log_path
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.exit_code == 0 and not self.timed_out
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return "ScriptResult(script=%r, exit_code=%r, duration=%.1f, log_path=%r, timed_out=%r)" % (
+            self.script, self.exit_code, self.duration, self.log_path, self.timed_out)
+
+
 class RunAbaqus(object):
     """
     直接Popen中打abaqus 开头的命令会得到文件无效的Windows Error返回值。
     要找到exe的路径.
     """
 
-    def __init__(self, abaqus_dir, abaqus_exe_path, script_path, pre_script, post_script):
+    def __init__(self, abaqus_dir, abaqus_exe_path, script_path, pre_script, post_script,
+                 worker_script="worker.py", pre_solve_post_script="pre_solve_post.py", timeouts=None, metrics=None):
         self.abaqus_exe_path = abaqus_exe_path
         self.abaqus_dir = abaqus_dir
         self.script_path = script_path
         self.pre_script = pre_script
         self.post_script = post_script
+        self.worker_script = worker_script
+        self.pre_solve_post_script = pre_solve_post_script
+        self.worker_dir = None
+        self.worker_process = None
+        # 本次启动的worker的标识, worker领取请求时写在<id>.<token>.run中
+        self.worker_token = None
+        # 多个线程共用一个RunAbaqus时, 同时超时的请求会同时停止worker
+        self.worker_lock = threading.Lock()
+        self.heartbeat_timeout = 30.0
+        # 各脚本的超时时间(秒), 如{"pre.py": 3600}; 没有给出的脚本不限制
+        self.timeouts = timeouts if timeouts is not None else {}
+        # 每次执行脚本的耗时写入metrics(Metrics), 为None时不记录
+        self.metrics = metrics
+
+    @classmethod
+    def exec_script(cls, abaqus_exe_path, script_path, script_name, json_path, json_file_name, abaqus_dir=os.getcwd(),
+                    timeout=None, log_path=None):
+        """同步调用exec_script_async, 参数和返回值相同。"""
+        return asyncio.run(cls.exec_script_async(
+            abaqus_exe_path=abaqus_exe_path,
+            script_path=script_path,
+            script_name=script_name,
+            json_path=json_path,
+            json_file_name=json_file_name,
+            abaqus_dir=abaqus_dir,
+            timeout=timeout,
+            log_path=log_path
+        ))
 
     @classmethod
-    def exec_script(cls, abaqus_exe_path, script_path, script_name, json_path, json_file_name, abaqus_dir=os.getcwd()):
+    async def exec_script_async(cls, abaqus_exe_path, script_path, script_name, json_path, json_file_name,
+                                abaqus_dir=os.getcwd(), timeout=None, log_path=None, encoding="gbk"):
+        """启动一个cae进程执行脚本, 逐行读取并解码stdout和stderr, 同时写入日志文件。
+        超时、被取消或者出错时杀掉整个进程树。
+        :param timeout: 超时时间(秒), None表示不限制
+        :param log_path: 日志文件, 默认与json文件同目录, 名为<json文件名>.<脚本名>.log
+        :param encoding: cae输出的编码
+        :return: ScriptResult
+        """
         script = script_path + "/" + script_name
         args = [abaqus_exe_path, "cae", "noGUI=%s" % script]
         env = os.environ.copy()
         env["JSON"] = json_path + "/" + json_file_name
+        if log_path is None:
+            log_path = "%s/%s.%s.log" % (json_path, os.path.splitext(json_file_name)[0], os.path.splitext(script_name)[0])
+        start = time.time()
+        try:
+            p = await asyncio.create_subprocess_exec(*args, cwd=abaqus_dir, stdout=PIPE, stderr=STDOUT, env=env,
+                                                     **cls.new_group_kwargs())
+        except Exception as e:
+            print(e)
+            return ScriptResult(script, None, time.time() - start, None)
+
+        async def communicate(log):
+            while True:
+                line = await p.stdout.readline()
+                if not line:
+                    break
+                line = line.decode(encoding, errors="replace")
+                print(line, end="")
+                log.write(line)
+                log.flush()
+            return await p.wait()
+
+        timed_out = False
+        with open(log_path, "w", encoding="utf-8") as log:
+            try:
+                exit_code = await asyncio.wait_for(communicate(log), timeout)
+            except asyncio.TimeoutError:
+                print("%s timeout after %ss, kill it!" % (script, timeout))
+                timed_out = True
+                cls.kill_tree(p.pid)
+                exit_code = await p.wait()
+            except BaseException:
+                # 被取消或者读取输出出错时, 同样不能留下cae进程
+                cls.kill_tree(p.pid)
+                await p.wait()
+                raise
+        return ScriptResult(script, exit_code, time.time() - start, log_path, timed_out)
+
+    @classmethod
+    def new_group_kwargs(cls):
+        """让子进程自成一个进程组, 以便连同它启动的求解器进程一起杀掉。"""
+        if os.name == "nt":
+            return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        return {"start_new_session": True}
+
+    @classmethod
+    def kill_tree(cls, pid):
+        """杀掉pid及其所有子进程。
+        :param pid: 用new_group_kwargs启动的进程
+        :return:
+        """
+        try:
+            if os.name == "nt":
+                subprocess.call(["taskkill", "/F", "/T", "/PID", str(pid)], stdout=DEVNULL, stderr=DEVNULL)
+            else:
+                os.killpg(pid, signal.SIGKILL)
+        except (OSError, ProcessLookupError):
+            pass
+
+    def start_worker(self, worker_dir, args=None, heartbeat_timeout=30.0):
+        """启动常驻的CAE worker(abaqus_api/worker.py), 之后的脚本都提交给它执行。
+        :param worker_dir: worker的请求目录
+        :param args: 启动worker的命令, 默认用abaqus cae noGUI启动; 测试时可以直接用python启动替身
+        :param heartbeat_timeout: 超过这个时间没有心跳就认为worker已经退出
+        :return: worker是否启动成功
+        """
+        if not os.path.isdir(worker_dir):
+            os.makedirs(worker_dir)
+        if args is None:
+            args = [self.abaqus_exe_path, "cae", "noGUI=%s" % (self.script_path + "/" + self.worker_script)]
+        # 清理上一次异常退出的worker留下的心跳和请求, 新的worker不能执行过期的请求
+        for name in os.listdir(worker_dir):
+            if name == "heartbeat" or os.path.splitext(name)[1] in (".req", ".run", ".res", ".tmp"):
+                os.remove(os.path.join(worker_dir, name))
+        token = uuid4().hex
+        env = os.environ.copy()
+        env["WORKER_DIR"] = worker_dir
+        env["WORKER_TOKEN"] = token
         try:
-            p = subprocess.Popen(args, cwd=abaqus_dir, stdout=PIPE, env=env)
-            res = p.communicate()
-            for line in res:
-                if line is not None:
-                    line = line.decode("gbk")
-                    print(line)
+            self.worker_process = subprocess.Popen(args, cwd=self.abaqus_dir, env=env, **self.new_group_kwargs())
         except Exception as e:
             print(e)
             return False
+        self.worker_dir = worker_dir
+        self.worker_token = token
+        self.heartbeat_timeout = heartbeat_timeout
+        deadline = time.time() + heartbeat_timeout
+        while not self.worker_alive():
+            if time.time() > deadline or self.worker_process.poll() is not None:
+                print("worker fail to start!")
+                self.stop_worker()
+                return False
+            time.sleep(0.1)
         return True
 
+    def worker_alive(self):
+        """worker进程还在运行并且心跳没有超时。
+        CAE中长时间求解时心跳线程可能得不到执行, 所以worker领取了请求(有<id>.<token>.run文件)时只看进程是否还在。
+        :return:
+        """
+        if self.worker_dir is None:
+            return False
+        if self.worker_process is not None and self.worker_process.poll() is not None:
+            return False
+        if self.worker_busy():
+            return True
+        try:
+            age = time.time() - os.path.getmtime(os.path.join(self.worker_dir, "heartbeat"))
+        except OSError:
+            return False
+        return age < self.heartbeat_timeout
+
+    def worker_busy(self):
+        """本次启动的worker正在执行请求。"""
+        suffix = ".%s.run" % self.worker_token
+        try:
+            return any(name.endswith(suffix) for name in os.listdir(self.worker_dir))
+        except OSError:
+            return False
+
+    def submit(self, script_name, json_path, json_file_name, timeout=None, poll_interval=0.2):
+        """把脚本提交给worker执行并等待结果。超时时杀掉worker, 不再重复执行这个作业。
+        :return: ScriptResult, worker还没有领取请求就退出时返回None; 领取后退出时返回失败的ScriptResult
+        """
+        job_id = uuid4().hex
+        script = self.script_path + "/" + script_name
+        req_file = os.path.join(self.worker_dir, job_id + ".req")
+        res_file = os.path.join(self.worker_dir, job_id + ".res")
+        req = {
+            "script": script,
+            "json": json_path + "/" + json_file_name,
+            "cwd": self.abaqus_dir,
+        }
+        start = time.time()
+        with open(req_file + ".tmp", "w") as f:
+            f.write(json.dumps(req))
+        os.rename(req_file + ".tmp", req_file)
+        while not os.path.exists(res_file):
+            proc = self.worker_process
+            if timeout is not None and time.time() - start > timeout:
+                print("%s timeout after %ss, kill the worker!" % (script, timeout))
+                if proc is not None:
+                    self.kill_tree(proc.pid)
+                self.stop_worker()
+                return ScriptResult(script, None, time.time() - start, None, timed_out=True)
+            if proc is None or proc.poll() is not None:
+                if os.path.exists(res_file):
+                    break
+                if self.withdraw(req_file):
+                    return None
+                # 请求已经被worker领取, 不能再用one-shot方式重复计算
+                print("worker exit while running %s!" % script)
+                return ScriptResult(script, None, time.time() - start, None)
+            if not self.worker_alive() and self.withdraw(req_file):
+                return None
+            time.sleep(poll_interval)
+        with open(res_file, "r") as f:
+            res = json.load(f)
+        os.remove(res_file)
+        if not res["ok"]:
+            print(res["error"])
+        return ScriptResult(script, 0 if res["ok"] else 1, time.time() - start, None)
+
+    @classmethod
+    def withdraw(cls, req_file):
+        """撤回还没有被worker领取的请求。
+        :return: 是否撤回成功
+        """
+        try:
+            os.remove(req_file)
+        except OSError:
+            return False
+        return True
+
+    def stop_worker(self, timeout=30.0):
+        with self.worker_lock:
+            if self.worker_alive():
+                stop_file = os.path.join(self.worker_dir, uuid4().hex + ".req")
+                with open(stop_file + ".tmp", "w") as f:
+                    f.write(json.dumps({"stop": True}))
+                os.rename(stop_file + ".tmp", stop_file)
+            proc = self.worker_process
+            if proc is not None:
+                try:
+                    proc.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    self.kill_tree(proc.pid)
+                    proc.wait()
+            self.worker_dir = None
+            self.worker_process = None
+            self.worker_token = None
+
+    def run_script(self, script_name, json_path, json_file_name):
+        """有worker时提交给worker执行, worker退出时退回到每次启动一个cae进程的方式。
+        超时时间由self.timeouts按脚本名给出。
+        :return: ScriptResult
+        """
+        timeout = self.timeouts.get(script_name)
+        ret = None
+        mode = "worker"
+        if self.worker_alive():
+            ret = self.submit(script_name, json_path, json_file_name, timeout=timeout)
+            if ret is None:
+                print("worker is dead, fall back to one-shot mode.")
+                self.stop_worker()
+        if ret is None:
+            mode = "one-shot"
+            ret = self.exec_script(
+                abaqus_exe_path=self.abaqus_exe_path,
+                script_path=self.script_path,
+                script_name=script_name,
+                json_path=json_path,
+                json_file_name=json_file_name,
+                abaqus_dir=self.abaqus_dir,
+                timeout=timeout
+            )
+        self.report("script", script=script_name, json=json_file_name, mode=mode, wall_time=ret.duration,
+                    exit_code=ret.exit_code, timed_out=ret.timed_out)
+        return ret
+
+    def report(self, event, **fields):
+        """写一条记录到metrics, 没有metrics时什么也不做。"""
+        if self.metrics is not None:
+            self.metrics.write(dict(fields, event=event))
+
     def pre_process(self, json_path, json_file_name):
-        ret = self.exec_script(
-            abaqus_exe_path=self.abaqus_exe_path,
-            script_path=self.script_path,
-            script_name=self.pre_script,
-            json_path=json_path,
-            json_file_name=json_file_name,
-            abaqus_dir=self.abaqus_dir
-        )
+        ret = self.run_script(self.pre_script, json_path, json_file_name)
         script = self.script_path + "/" + self.pre_script
         if ret:
             print("%s success!" % script)
         else:
             print("%s fail!" % script)
+        return ret
 
     def post_process(self, json_path, json_file_name):
-        ret = self.exec_script(
-            abaqus_exe_path=self.abaqus_exe_path,
-            script_path=self.script_path,
-            script_name=self.post_script,
-            json_path=json_path,
-            json_file_name=json_file_name,
-            abaqus_dir=self.abaqus_dir
-        )
+        ret = self.run_script(self.post_script, json_path, json_file_name)
         script = self.script_path + "/" + self.post_script
         if ret:
             print("%s success!" % script)
         else:
             print("%s fail!" % script)
+        return ret
+
+    @classmethod
+    def status_file(cls, json_path, json_file_name):
+        """pre_solve_post脚本写出的状态文件, 与JSON文件同名, 后缀为.status.json"""
+        return os.path.splitext(json_path + "/" + json_file_name)[0] + ".status.json"
+
+    def pre_solve_post(self, json_path, json_file_name):
+        """在一个CAE进程中完成建模、阻塞求解和后处理。
+        :return: 状态字典, {"ok": ..., "stage": ..., "job_status": ..., "error": ..., "duration": {...},
+            "wall_time": cae进程的总耗时}
+        """
+        status_file = self.status_file(json_path, json_file_name)
+        if os.path.exists(status_file):
+            os.remove(status_file)
+        ret = self.run_script(self.pre_solve_post_script, json_path, json_file_name)
+        script = self.script_path + "/" + self.pre_solve_post_script
+        try:
+            with open(status_file, "r") as f:
+                status = json.load(f)
+        except (IOError, ValueError) as e:
+            status = {"ok": False, "stage": None, "job_status": None, "duration": {},
+                      "error": "%s exit without a valid status file: %s" % (script, e)}
+        status["ok"] = ret.ok and status["ok"]
+        status["exit_code"] = ret.exit_code
+        status["timed_out"] = ret.timed_out
+        status["log_path"] = ret.log_path
+        status["wall_time"] = ret.duration
+        # cae启动、读写文件等不在各阶段计时中的时间
+        stages = status.get("duration") or {}
+        self.report("pre_solve_post", json=json_file_name, ok=status["ok"], stage=status["stage"],
+                    wall_time=ret.duration, stages=stages, overhead=ret.duration - sum(stages.values()))
+        if status["ok"]:
+            print("%s success!" % script)
+        else:
+            print("%s fail at stage %s!" % (script, status["stage"]))
+        return status
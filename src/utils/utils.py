@@ -1,15 +1,16 @@
 # -*- coding:utf-8 -*-
 
-import json
 import os
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from math import floor, ceil
 from operator import itemgetter
 
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
-from scipy.optimize import brenth
+from scipy.interpolate import InterpolatedUnivariateSpline, PPoly
 
+from .interchange import save_data
+from .layout import QUANTIZE_ACCURACY, Layout, quantize
 from .my_types import Point2
 
 DEBUG = True
@@ -55,6 +56,20 @@ class Common(object):
         # spl = UnivariateSpline(xx, yy, w=w, s=0)
         return spl
 
+    @staticmethod
+    def get_tck(spl):
+        """由样条函数的公开接口还原(t, c, k)。
+        get_knots只返回不重复的节点, 完整的节点向量两端各重复k+1次; c按FITPACK的习惯补0到与t等长。
+        :param spl: get_spl生成的样条函数
+        :return: (t, c, k)
+        """
+        knots = spl.get_knots()
+        coeffs = spl.get_coeffs()
+        k = len(coeffs) + 1 - len(knots)
+        t = np.concatenate((np.repeat(knots[:1], k), knots, np.repeat(knots[-1:], k)))
+        c = np.concatenate((coeffs, np.zeros(k + 1)))
+        return t, c, k
+
     @classmethod
     def root(cls, spl, y, start, stop, scan_step=0.025):
         """计算样条曲线在y处于某个值时, 在[start, stop]范围内的交点
@@ -65,17 +80,29 @@ class Common(object):
             :param scan_step: 扫描的精度, 默认0.05
             :return: 根的列表
             """
+        from scipy.optimize import brenth
         out = []
 
         def func(x):
             return spl(x) - y
 
-        # 在[start, stop]上搜索求根。
-        for i in np.arange(start - 0.1, stop + 0.1, step=scan_step):
-            if (func(i) <= 0 < func(i + scan_step)) or (func(i) >= 0 > func(i + scan_step)):
-                x0, r = brenth(func, i, i + scan_step, full_output=True)
-                x_val = float(x0)
-                out.append((x_val, y), )
+        # 在[start, stop]上搜索求根: 一次性对整个扫描网格的左右端点求值, 用numpy找出变号区间。
+        left = np.arange(start - 0.1, stop + 0.1, step=scan_step)
+        f_left, f_right = spl(np.vstack((left, left + scan_step))) - y
+        brackets = ((f_left <= 0) & (0 < f_right)) | ((f_left >= 0) & (0 > f_right))
+        # 只在找到的变号区间上调用brenth
+        for i in left[brackets]:
+            x0, r = brenth(func, i, i + scan_step, full_output=True)
+            x_val = float(x0)
+            out.append((x_val, y), )
+        return cls.prune_roots(out)
+
+    @classmethod
+    def prune_roots(cls, out):
+        """对求得的根的列表做奇数个根的修剪, 保证输出的根能两两配对。
+        :param out: 根的列表, [(x1, y), (x2, y), ...], x依次增大
+        :return: 修剪后的根的列表
+        """
         # 当根的个数是技术的时候，分成1个或者3个及以上的情况来处理。
         if len(out) % 2 != 0 and len(out) > 1:
             tmp = []
@@ -87,6 +114,40 @@ class Common(object):
             out = []
         return out
 
+    @classmethod
+    def root_levels(cls, spl, levels, start, stop, tol=1e-9):
+        """把样条曲线转换成分段多项式, 对所有的y值一次性求各节点区间上三次多项式的根。
+        与root相同, 只保留[start-0.1, stop+0.1]范围内变号的根, 并做同样的奇数根修剪。
+        :param spl: 样条函数
+        :param levels: y值的序列
+        :param start: 求交范围的起点
+        :param stop: 求交范围的终点
+        :param tol: 判断重根和变号的精度
+        :return: 根的列表的列表, 与levels一一对应
+        """
+        levels = np.asarray(levels, dtype=float)
+        if len(levels) == 0:
+            return []
+        pp = PPoly.from_spline(cls.get_tck(spl))
+        # 每个y值对应一列, 常数项减去y值, 一次求解所有的水平线
+        c = np.repeat(pp.c[:, :, np.newaxis], len(levels), axis=2)
+        c[-1] -= levels
+        batch = PPoly.construct_fast(c, pp.x, extrapolate=True)
+        roots_per_level = batch.solve(0.0, discontinuity=False)
+
+        out = []
+        for y, roots in zip(levels, roots_per_level):
+            roots = roots[(roots >= start - 0.1) & (roots <= stop + 0.1)]
+            if len(roots) == 0:
+                out.append([])
+                continue
+            roots = roots[np.concatenate(([True], np.diff(roots) > tol))]
+            # 去掉只相切而不穿过的根, 与扫描法的变号判断保持一致
+            f_left, f_right = spl(np.vstack((roots - 1e3 * tol, roots + 1e3 * tol))) - y
+            roots = roots[np.sign(f_left) != np.sign(f_right)]
+            out.append(cls.prune_roots([(float(x), float(y)) for x in roots]))
+        return out
+
     @classmethod
     def second_diff(cls, p1: Point2, p2: Point2, p3: Point2) -> float:
         """给定p1, p2, p3, x值依次增大, 求其二阶差商。
@@ -104,13 +165,18 @@ class Common(object):
 
 class GenerateCoord(object):
     @classmethod
-    def generate_xcoord(cls, spl, start, stop, step=1.0):
-        out = []
+    def columns(cls, start, stop, step=1.0):
+        """X向杆件所在的x值, 不包括左右边界。"""
         if start != ceil(start):
             start = ceil(start)
         else:
             start = start + step
-        for x in np.arange(start, stop, step):
+        return np.arange(start, stop, step)
+
+    @classmethod
+    def generate_xcoord(cls, spl, start, stop, step=1.0):
+        out = []
+        for x in cls.columns(start, stop, step):
             y = float(spl(x))
             if y < 1.0:  # 过滤掉'孤儿点'
                 continue
@@ -118,6 +184,58 @@ class GenerateCoord(object):
             out.append(pt_pair)
         return out
 
+    @classmethod
+    def update_xcoord(cls, spl_old, spl, old_xcoord, start, stop, step=1.0, tol=QUANTIZE_ACCURACY):
+        """增量生成xcoord: 只重新生成新旧样条曲线在x处相差超过tol的杆件, 其余沿用old_xcoord。
+        :param spl_old: 生成old_xcoord的样条函数
+        :param spl: 新的样条函数
+        :param old_xcoord: 原来的X向杆件的坐标对列表
+        :return: xcoord, 重新生成的杆件所在x的量化值的集合
+        """
+        xs = cls.columns(start, stop, step)
+        changed = np.abs(spl(xs) - spl_old(xs)) > tol
+        old = dict((cls.quantize(pair[0][0]), pair) for pair in old_xcoord)
+        out = []
+        keys = set()
+        for x, is_changed in zip(xs.tolist(), changed.tolist()):
+            key = cls.quantize(x)
+            if not is_changed:
+                if key in old:
+                    out.append(old[key])
+                continue
+            keys.add(key)
+            y = float(spl(x))
+            if y < 1.0:  # 过滤掉'孤儿点'
+                continue
+            out.append([(x, y), (x, -y)])
+        return out, keys
+
+    @classmethod
+    def changed_levels(cls, spl_old, spl, levels, start, stop, tol=QUANTIZE_ACCURACY, scan_step=0.005):
+        """找出交点可能因样条曲线的变化而不同的y值。
+        在求交范围[start-0.1, stop+0.1]上按scan_step采样, 新旧曲线相差超过tol的小区间上,
+        两条曲线取值范围内的y值都可能有不同的交点, 其余y值的交点不变。
+        :param spl_old: 原来的样条函数
+        :param spl: 新的样条函数
+        :param levels: y值的序列, 从小到大
+        :return: 与levels等长的bool数组
+        """
+        levels = np.asarray(levels, dtype=float)
+        xs = np.arange(start - 0.1, stop + 0.1 + scan_step, scan_step)
+        y_old, y_new = spl_old(xs), spl(xs)
+        diff = np.abs(y_new - y_old) > tol
+        cells = diff[:-1] | diff[1:]
+        marks = np.zeros(len(levels) + 1, dtype=int)
+        if cells.any():
+            ends = np.vstack((y_old[:-1], y_old[1:], y_new[:-1], y_new[1:]))[:, cells]
+            # 小区间内的样条曲线可能略微超出端点的取值, 留一点余量
+            margin = 2 * scan_step
+            lo = np.searchsorted(levels, ends.min(axis=0) - margin, side='left')
+            hi = np.searchsorted(levels, ends.max(axis=0) + margin, side='right')
+            np.add.at(marks, lo, 1)
+            np.add.at(marks, hi, -1)
+        return np.cumsum(marks[:-1]) > 0
+
     @classmethod
     def need_to_skip(cls, x1, x2):
         """本函数服务于generate_ycoord，用于改善求交中畸变的情况。
@@ -137,7 +255,7 @@ class GenerateCoord(object):
             return False
 
     @classmethod
-    def generate_ycoord(cls, spl, start, stop, step=1.0, *custom):
+    def generate_ycoord(cls, spl, start, stop, step=1.0, *custom, method="scan", known_roots=None, roots=None):
         """
         在[start, stop]范围内求交生成ycoord杆件布置。
         :param spl:
@@ -145,6 +263,9 @@ class GenerateCoord(object):
         :param stop:
         :param step:
         :param custom:
+        :param method: 求交的方式, "scan"对每个y值扫描求根, "ppoly"按分段多项式一次求出所有y值的根
+        :param known_roots: 已知的各y值的根, 不为None的直接使用, 不再求交
+        :param roots: 不为None时, 把用到的各y值的根依次追加到这个列表中, 到第一个没有根的y值为止
         :return:一个坐标对的列表。[[point1, point2], [point3, point4], ...]
         """
         assert len(custom) == 2 or len(custom) == 0
@@ -154,8 +275,21 @@ class GenerateCoord(object):
         else:
             out = [[(start, 0.0), (stop, 0.0)], ]
             x_c, y_c = start, stop
-        for y in np.arange(0.0 + step, stop, step):
-            root_result = Common.root(spl, y, x_c, y_c, scan_step=0.005)
+        levels = np.arange(0.0 + step, stop, step)
+        known = known_roots if known_roots is not None else []
+        todo = [k for k in range(len(levels)) if k >= len(known) or known[k] is None]
+        if method == "ppoly":
+            solved = dict(zip(todo, Common.root_levels(spl, levels[todo], x_c, y_c)))
+            root_results = (solved[k] if k in solved else known[k] for k in range(len(levels)))
+        elif method == "scan":
+            todo = set(todo)
+            root_results = (Common.root(spl, y, x_c, y_c, scan_step=0.005) if k in todo else known[k]
+                            for k, y in enumerate(levels))
+        else:
+            raise Exception("Unknown root method %r" % method)
+        for root_result in root_results:
+            if roots is not None:
+                roots.append(root_result)
             if len(root_result) % 2 != 0:
                 raise Exception("Wrong Root List %r" % root_result)
             if len(root_result) == 0:
@@ -184,18 +318,108 @@ class GenerateCoord(object):
         else:
             return None
 
+    @classmethod
+    def quantize(cls, pt, accuracy=QUANTIZE_ACCURACY):
+        """见layout.quantize, ResultCache的缓存键也用它量化。"""
+        return quantize(pt, accuracy)
+
     @classmethod
     def generate_incoord(cls, xcoord, ycoord):
-        incoord_set = set()
+        """由xcoord和ycoord求内部交点。Y向杆件按所在的y值分行索引,
+        每根X向杆件只查找它跨过的那些行, 复杂度为O((n+m)log m + 交点数)。
+        :param xcoord: X向杆件的坐标对列表
+        :param ycoord: Y向杆件的坐标对列表
+        :return: 内部点的列表
+        """
+        # 每根杆件的端点只排序一次: X向杆件按y排序, Y向杆件按x排序
+        for x_pair in xcoord:
+            x_pair.sort(key=itemgetter(1))
+        rows = dict()
+        for y_pair in ycoord:
+            y_pair.sort(key=itemgetter(0))
+            y = y_pair[0][1]
+            rows.setdefault(cls.quantize(y), (y, []))[1].append((y_pair[0][0], y_pair[1][0]))
+        # 按y值排序的行: y值, 量化后的y值, 该行上各杆件的x范围
+        row_keys = sorted(rows, key=lambda k: rows[k][0])
+        row_ys = [rows[k][0] for k in row_keys]
+        row_spans = [rows[k][1] for k in row_keys]
+
+        incoord = dict()
         for x_pair in xcoord:
-            for y_pair in ycoord:
-                pt = cls.get_cross_point(x_pair, y_pair)
-                incoord_set.add(pt)
-        if None in incoord_set:
-            incoord_set.remove(None)
-        out = list(incoord_set)
+            x = x_pair[0][0]
+            key_x = cls.quantize(x)
+            lo = bisect_right(row_ys, x_pair[0][1])
+            hi = bisect_left(row_ys, x_pair[1][1])
+            for i in range(lo, hi):
+                for x1, x2 in row_spans[i]:
+                    if x1 < x < x2:
+                        incoord.setdefault((key_x, row_keys[i]), (x, row_ys[i]))
+        out = list(incoord.values())
         return out
 
+    @classmethod
+    def footprints(cls, pairs, axis, grid, accuracy=QUANTIZE_ACCURACY):
+        """杆件跨过的网格线。内部点都在X向杆件所在的x值和Y向杆件所在的y值上,
+        杆件端点的微小移动只要没有跨过网格线, 它和其它杆件的交点就不变。
+        :param pairs: 杆件的坐标对列表
+        :param axis: 杆件所在位置的坐标轴, X向杆件为0, Y向杆件为1
+        :param grid: 沿杆件方向的网格线坐标, 从小到大
+        :return: 与pairs等长的列表, 每个元素为(所在位置的量化值, 跨过的第一条网格线, 最后一条网格线之后)
+        """
+        if not pairs:
+            return []
+        ends = np.asarray(pairs, dtype=np.float64).reshape(-1, 2, 2)[:, :, 1 - axis]
+        lo = np.searchsorted(grid, ends.min(axis=1), side='right')
+        hi = np.searchsorted(grid, ends.max(axis=1), side='left')
+        keys = np.rint(np.asarray([pair[0][axis] for pair in pairs]) / accuracy).astype(np.int64)
+        return list(zip(keys.tolist(), lo.tolist(), hi.tolist()))
+
+    @classmethod
+    def update_incoord(cls, old_incoord, old_xcoord, old_ycoord, xcoord, ycoord, accuracy=QUANTIZE_ACCURACY):
+        """增量求内部交点: 只有跨过的网格线发生变化的杆件参与求交, 其余的交点沿用old_incoord。
+        结果按(x, y)排序, 与generate_incoord的顺序相同。
+        :param old_incoord: 原来的内部点, (M, 2)的数组
+        :param old_xcoord: 原来的X向杆件的坐标对列表
+        :param old_ycoord: 原来的Y向杆件的坐标对列表
+        :param xcoord: 新的X向杆件的坐标对列表
+        :param ycoord: 新的Y向杆件的坐标对列表
+        :return: 内部点的(K, 2)数组, 新求出的交点数
+        """
+        old_incoord = np.asarray(old_incoord, dtype=np.float64).reshape(-1, 2)
+        grid_x = np.unique([pair[0][0] for pair in old_xcoord + xcoord])
+        grid_y = np.unique([y for pair in old_ycoord + ycoord for y in (pair[0][1], -pair[0][1])])
+        old_fx = cls.footprints(old_xcoord, 0, grid_y, accuracy)
+        new_fx = cls.footprints(xcoord, 0, grid_y, accuracy)
+        old_fy = cls.footprints(old_ycoord, 1, grid_x, accuracy)
+        new_fy = cls.footprints(ycoord, 1, grid_x, accuracy)
+
+        # 跨过的网格线变化了的X向杆件所在的x, 这些x上的交点全部重新求
+        changed_x = set(f[0] for f in set(old_fx).symmetric_difference(new_fx))
+        kept_x = [pair for pair, f in zip(xcoord, new_fx) if f[0] not in changed_x]
+        new_x = [pair for pair, f in zip(xcoord, new_fx) if f[0] in changed_x]
+        same_fy = set(old_fy).intersection(new_fy)
+        removed_y = [pair for pair, f in zip(old_ycoord, old_fy) if f not in same_fy]
+        new_y = [pair for pair, f in zip(ycoord, new_fy) if f not in same_fy]
+
+        # 没有变化的X向杆件与已经不存在的Y向杆件的交点
+        dropped = np.asarray(cls.generate_incoord(kept_x, removed_y), dtype=np.float64).reshape(-1, 2)
+        quantized = np.rint(old_incoord / accuracy).astype(np.int64)
+        keep = ~np.isin(quantized[:, 0], list(changed_x))
+        if len(dropped):
+            dropped = set(map(tuple, np.rint(dropped / accuracy).astype(np.int64).tolist()))
+            keep &= np.array([key not in dropped for key in map(tuple, quantized.tolist())], dtype=bool)
+        # 重新求交的两部分没有重叠: 变化的X向杆件与所有Y向杆件, 没有变化的X向杆件与变化的Y向杆件
+        new_points = cls.generate_incoord(new_x, ycoord) + cls.generate_incoord(kept_x, new_y)
+
+        points = np.concatenate((old_incoord[keep], np.asarray(new_points, dtype=np.float64).reshape(-1, 2)))
+        keys = np.rint(points / accuracy).astype(np.int64)
+        # 稳定排序, 同一个点保留最先出现的
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+        return points[order[first]], len(new_points)
+
 
 class GenerateAbaqusData(object):
     @classmethod
@@ -227,7 +451,7 @@ class GenerateAbaqusData(object):
                 json_save_dir=os.getcwd()):
         """
         把平面布置的结果转换成abaqus前处理的文件。
-        :param d_in: 平面布置的数据, 字典格式
+        :param d_in: 平面布置的数据, Layout或者InitPlain.to_json的字典
         :param json_save_dir: 输出的json的保存路径
         :param json_file_name: json文件名
         :param abaqus_dir: abaqus工作目录
@@ -244,15 +468,16 @@ class GenerateAbaqusData(object):
         :param thickness: 厚度
         :param radius: 半径
         :param res_file_prefix:
-        :return:
+        :return: 字典, 坐标字段为Layout中数组的视图
         """
-        xcoord = d_in['xcoord']
-        ycoord = d_in['ycoord']
-        incoord = d_in['incoord']
+        layout = d_in if isinstance(d_in, Layout) else Layout.from_dict(d_in)
+        xcoord = layout.xcoord
+        ycoord = layout.ycoord
+        incoord = layout.incoord
 
-        xcoord_3d = cls.to_3d_xy(xcoord)
-        ycoord_3d = cls.to_3d_xy(ycoord)
-        incoord_3d = cls.to_3d_inner(incoord)
+        xcoord_3d = layout.xcoord_3d
+        ycoord_3d = layout.ycoord_3d
+        incoord_3d = layout.incoord_3d
 
         d_out = dict()
         d_out['iter_time'] = iter_time
@@ -281,11 +506,11 @@ class GenerateAbaqusData(object):
         d_out['res_file_prefix'] = res_file_prefix
         d_out['json_save_dir'] = json_save_dir
 
-        if not json_file_name.endswith(".json"):
+        if not json_file_name.endswith((".json", ".npz")):
             json_file_name = json_file_name + ".json"
 
-        with open(json_save_dir + "/" + json_file_name, "w") as f:
-            f.writelines(json.dumps(d_out, indent=4), )
+        # 以.npz结尾时保存为二进制格式
+        save_data(json_save_dir + "/" + json_file_name, d_out)
         return d_out
 
 
@@ -295,95 +520,185 @@ class InitPlain(object):
     输入点坐标列表，输出平面布置的json和示意图。
     """
 
-    def __init__(self, pt_list):
+    def __init__(self, pt_list, root_method="scan", previous=None, tol=QUANTIZE_ACCURACY):
+        """
+        :param pt_list: 边界控制点
+        :param root_method: ycoord的求交方式, 见GenerateCoord.generate_ycoord
+        :param previous: 上一次的InitPlain, 给出时只重新生成样条曲线变化超过tol的杆件和交点
+        :param tol: 增量生成时判断样条曲线是否变化的精度, 默认与quantize的量化精度相同;
+            全局三次样条在一个控制点移动后处处都有微小的变化, 小于tol的变化不重新计算
+        """
         self.pt_list = sorted(pt_list, key=itemgetter(0))
         self.lb = self.pt_list[0][0]  # left_bound
         self.rb = self.pt_list[-1][0]  # right_bound
 
         assert self.pt_list[0][1] == self.pt_list[-1][1] == 0.0  # 确保两边的点在对称轴上
 
+        self.root_method = root_method
         self.spl = Common.get_spl(self.pt_list)
-
-        self.xcoord = GenerateCoord.generate_xcoord(self.spl, self.lb, self.rb, 1.0)
-        self.ycoord = GenerateCoord.generate_ycoord(self.spl, self.lb, self.rb, 1.0)
-        self.incoord = GenerateCoord.generate_incoord(self.xcoord, self.ycoord)
+        # 每个y值的根, 到第一个没有根的y值为止, 增量生成时沿用没有变化的部分
+        self.roots = []
+
+        self.layout = None
+        if previous is not None and self.can_update(previous):
+            self.layout = self.update(previous, tol)
+        if self.layout is None:
+            xcoord = GenerateCoord.generate_xcoord(self.spl, self.lb, self.rb, 1.0)
+            ycoord = GenerateCoord.generate_ycoord(self.spl, self.lb, self.rb, 1.0, method=root_method,
+                                                   roots=self.roots)
+            incoord = GenerateCoord.generate_incoord(xcoord, ycoord)
+            # 重新生成的X向杆件、求交的y值和新求出的内部点的个数
+            self.recomputed = {'xcoord': len(xcoord), 'levels': len(self.roots), 'incoord': len(incoord)}
+            self.layout = Layout(xcoord, ycoord, incoord, self.lb, self.rb)
+
+    def can_update(self, previous):
+        """X向杆件所在的x值、求交的y值和求交方式都相同时才能在previous的基础上增量生成。"""
+        return (previous.root_method == self.root_method
+                and len(np.arange(1.0, previous.rb, 1.0)) == len(np.arange(1.0, self.rb, 1.0))
+                and np.array_equal(GenerateCoord.columns(previous.lb, previous.rb),
+                                   GenerateCoord.columns(self.lb, self.rb)))
+
+    def update(self, previous, tol=QUANTIZE_ACCURACY):
+        """比较新旧控制点和样条曲线, 只重新生成受影响的X向杆件、y值和交点, 其余沿用previous。
+        :param previous: 上一次的InitPlain
+        :param tol: 判断样条曲线是否变化的精度
+        :return: Layout, 没有可以沿用的杆件时返回None
+        """
+        if previous.pt_list == self.pt_list:
+            self.roots = previous.roots
+            self.recomputed = {'xcoord': 0, 'levels': 0, 'incoord': 0}
+            return previous.layout
+
+        xcoord, changed_x = GenerateCoord.update_xcoord(previous.spl, self.spl, previous.xcoord,
+                                                        self.lb, self.rb, 1.0, tol)
+        levels = np.arange(1.0, self.rb, 1.0)
+        # 边界移动时, 两次求交范围内的曲线都要比较
+        changed = GenerateCoord.changed_levels(previous.spl, self.spl, levels, min(previous.lb, self.lb),
+                                               max(previous.rb, self.rb), tol)
+        known = [None if changed[k] else r for k, r in enumerate(previous.roots)]
+        if len(changed_x) == len(GenerateCoord.columns(self.lb, self.rb)) and not any(known):
+            return None
+        ycoord = GenerateCoord.generate_ycoord(self.spl, self.lb, self.rb, 1.0, method=self.root_method,
+                                               known_roots=known, roots=self.roots)
+        reused = [k < len(known) and known[k] is not None for k in range(len(self.roots))]
+        incoord, n_incoord = GenerateCoord.update_incoord(previous.layout.incoord, previous.xcoord, previous.ycoord,
+                                                          xcoord, ycoord)
+        self.recomputed = {'xcoord': len(changed_x), 'levels': reused.count(False), 'incoord': n_incoord}
+        return Layout(xcoord, ycoord, incoord, self.lb, self.rb)
+
+    @property
+    def xcoord(self):
+        """X向杆件的坐标对列表, 由layout转换而来, 只用于兼容以前的接口。"""
+        return [[tuple(p) for p in pair] for pair in self.layout.xcoord.tolist()]
+
+    @property
+    def ycoord(self):
+        return [[tuple(p) for p in pair] for pair in self.layout.ycoord.tolist()]
+
+    @property
+    def incoord(self):
+        return [tuple(p) for p in self.layout.incoord.tolist()]
 
     def to_json(self, file_name: str, save_path=os.getcwd()):
-
-        if not file_name.endswith(".json"):
+        """
+        :return: 字典, 坐标字段为layout中数组的视图, 写json时才转换成列表
+        """
+        if not file_name.endswith((".json", ".npz")):
             file_name = file_name + ".json"
 
         d = {}
-        d['xcoord'] = self.xcoord
-        d['ycoord'] = self.ycoord
-        d['incoord'] = self.incoord
+        d['xcoord'] = self.layout.xcoord
+        d['ycoord'] = self.layout.ycoord
+        d['incoord'] = self.layout.incoord
         d['left_bound'] = self.lb
         d['right_bound'] = self.rb
-        with open(save_path + "/" + file_name, "w") as f:
-            f.writelines(json.dumps(d, indent=4))
+        # 以.npz结尾时保存为二进制格式
+        save_data(save_path + "/" + file_name, d)
         return d
 
-    def plot_xy(self, file_name=None, save_path=os.getcwd()):
-        """绘示意图。当file_name和save_path给了额外保存图像。
-        :param file_name:
-        :param save_path:
+    def draw(self, ax):
+        """在ax上绘制控制点、样条线、杆件和内部点, plot_xy和save_fig共用。
+        :param ax: matplotlib的Axes
         :return:
         """
-        fig = plt.figure(figsize=(15, 8))
-
         # 绘制控制点
         xx = Common.xlist(self.pt_list)
         yy = Common.ylist(self.pt_list)
-        plt.plot(xx, yy, 'r^', markersize=16)
+        ax.plot(xx, yy, 'r^', markersize=16)
 
         # 绘制拟合的样条线
         xx = np.linspace(self.lb, self.rb, 300)
         yy = self.spl(xx)
-        plt.plot(xx, yy, 'r--', linewidth=6)
+        ax.plot(xx, yy, 'r--', linewidth=6)
 
-        # 绘制边界点
-        for pt_pair in self.xcoord + self.ycoord:
-            xx = Common.xlist(pt_pair)
-            yy = Common.ylist(pt_pair)
-            plt.plot(xx, yy, linewidth=1.2)
+        # 绘制杆件, 每根杆件一条线
+        members, _ = self.layout.members()
+        if len(members):
+            ax.plot(members[:, :, 0].T, members[:, :, 1].T, linewidth=1.2)
 
         # 绘制内部点
-        for x, y in self.incoord:
-            plt.plot(x, y, 'ro', markersize=3.5)
+        if len(self.layout.incoord):
+            ax.plot(self.layout.incoord[:, 0], self.layout.incoord[:, 1], 'ro', markersize=3.5)
 
         # 调整图像显示
-        plt.xlim((self.lb, self.rb), )
+        ax.set_xlim((self.lb, self.rb), )
+
+    def plot_xy(self, file_name=None, save_path=os.getcwd()):
+        """绘示意图。当file_name和save_path给了额外保存图像。
+        :param file_name:
+        :param save_path:
+        :return:
+        """
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(figsize=(15, 8))
+        self.draw(ax)
         if file_name is not None:
             fig.savefig(save_path + "/" + file_name)
         plt.show()
+        plt.close(fig)
 
     def save_fig(self, file_name: str, save_path=os.getcwd()):
+        """用Agg画布保存示意图, 不经过pyplot, 图像用完即释放, 可以在后台线程中调用。
+        :param file_name:
+        :param save_path:
+        :return:
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
         if not file_name.endswith(".png"):
             file_name = file_name + ".png"
-        fig = plt.figure(figsize=(15, 8))
-        # 绘制控制点
-        xx = Common.xlist(self.pt_list)
-        yy = Common.ylist(self.pt_list)
-        plt.plot(xx, yy, 'r^', markersize=16)
+        fig = Figure(figsize=(15, 8))
+        FigureCanvasAgg(fig)
+        self.draw(fig.add_subplot(111))
+        fig.savefig(save_path + "/" + file_name)
 
-        # 绘制拟合的样条线
-        xx = np.linspace(self.lb, self.rb, 300)
-        yy = self.spl(xx)
-        plt.plot(xx, yy, 'r--', linewidth=6)
 
-        # 绘制边界点
-        for pt_pair in self.xcoord + self.ycoord:
-            xx = Common.xlist(pt_pair)
-            yy = Common.ylist(pt_pair)
-            plt.plot(xx, yy, linewidth=1.2)
+class PlotWorker(object):
+    """
+    在后台线程中依次保存示意图, 绘图不占用迭代的时间。
+    close()等待所有图像保存完。
+    """
 
-        # 绘制内部点
-        for x, y in self.incoord:
-            plt.plot(x, y, 'ro', markersize=3.5)
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
 
-        # 调整图像显示
-        plt.xlim((self.lb, self.rb), )
-        fig.savefig(save_path + "/" + file_name)
+    def submit(self, plain, file_name, save_path=os.getcwd()):
+        """
+        :param plain: InitPlain, 提交后不应再修改
+        :return: Future
+        """
+        future = self.executor.submit(plain.save_fig, file_name, save_path)
+        future.add_done_callback(self.report)
+        return future
+
+    @staticmethod
+    def report(future):
+        exception = future.exception()
+        if exception is not None:
+            print("Fail to save figure:", exception)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
 
 
 if __name__ == '__main__':
@@ -1,11 +1,51 @@
+import shutil
+import sys
+import tempfile
+import threading
+import time as _time
 import unittest
+from random import seed as random_seed
+
+from numpy import std
 
 from src.auto_iter import *
 
 
+class FakeProject(Project):
+    # 不调用abaqus, 用平面布置构造一个假想的变形结果
+    def __init__(self, *args, **kwargs):
+        super(FakeProject, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def solve(self, tmp_2nd_name, abq_name):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        _time.sleep(0.05)
+        d = self.fake_result(self.load_input(tmp_2nd_name))
+        with self.lock:
+            self.running -= 1
+        return d
+
+    @staticmethod
+    def fake_result(d):
+        to_odb = lambda p: [p[0], p[1], 0.0, p[0], p[1], -0.005 * abs(p[1])]
+        d['bound_pts'] = [to_odb(p) for pair in d['xcoord'] + d['ycoord'] for p in pair]
+        d['inner_pts'] = [to_odb(p) for p in d['incoord']]
+        d['bound_stderr'] = float(std([p[5] for p in d['bound_pts']]))
+        return d
+
+
 class AutoIterTest(unittest.TestCase):
     def setUp(self):
         super().setUp()
+        self.json_path = tempfile.mkdtemp()
+        self.pt_list = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+
+    def fake_project(self, project_name, cls=FakeProject, **kwargs):
+        return cls(project_name=project_name, json_path=self.json_path, abaqus_dir=self.json_path, **kwargs)
 
     def test_a_iter10times(self):
         proj = Project(project_name="luck-with-rand",
@@ -14,11 +54,240 @@ class AutoIterTest(unittest.TestCase):
                        step_factor=0.33, enable_rand=True,
                        iter_times=250)
 
-        pt_list = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        proj.run(self.pt_list)
+
+    def test_b_population(self):
+        proj = self.fake_project("population", step_factor=0.3, iter_times=2,
+                                 population=3, cpu_budget=8, cpus_per_job=4)
+        self.assertEqual(proj.pool_size(), 2)
+        self.assertEqual(len(proj.candidate_factors()), 3)
+        best = proj.run(self.pt_list)
+        self.assertEqual(best[0][1], 0.0)
+        self.assertEqual(proj.max_running, 2)
+        self.assertTrue(os.path.exists(self.json_path + "/population-2nd-1-2.json"))
+
+    def test_b_population_worker_pool(self):
+        # 每个线程池槽位使用自己的worker, 一个worker不会同时被两个候选布置使用
+        proj = self.fake_project("pool", worker_dir=self.json_path + "/worker",
+                                 population=3, cpu_budget=12, cpus_per_job=4)
+        worker_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     "abaqus_api", "worker.py")
+        proj.start_workers(args=[sys.executable, worker_script])
+        try:
+            self.assertEqual(len(proj.abaqus_envs), 3)
+            self.assertEqual(len(set(env.worker_dir for env in proj.abaqus_envs)), 3)
+            self.assertTrue(all(env.worker_alive() for env in proj.abaqus_envs))
+            used = []
+            barrier = threading.Barrier(3)
+
+            def hold():
+                with proj.acquire_abaqus() as env:
+                    used.append(env)
+                    barrier.wait(5.0)
+
+            threads = [threading.Thread(target=hold) for _ in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(len(set(map(id, used))), 3)
+        finally:
+            proj.stop_workers()
+        self.assertEqual(proj.abaqus_envs, [proj.abaqus_env])
+        self.assertFalse(proj.abaqus_env.worker_alive())
+
+    def test_c_multi_fidelity(self):
+        # 默认用LinearFrame近似计算
+        proj = self.fake_project("linear", verify_every=3)
+        abq_name, tmp_2nd_name = proj.prepare(self.pt_list, 0)
+        d = proj.solve_cheap(tmp_2nd_name, abq_name)
+        self.assertIn('bound_stderr', d)
+        self.assertTrue(os.path.exists(self.json_path + "/res_linear-0.json"))
+
+        proj = self.fake_project("fidelity", step_factor=0.3, iter_times=5, verify_every=3, cheap_tol=0.0,
+                                 cheap_solver=FakeProject.fake_result)
+        proj.run(self.pt_list)
+        fidelities = [record["fidelity"] for record in proj.history]
+        self.assertEqual(fidelities, ["abaqus", "cheap", "cheap", "abaqus", "cheap"])
+        summary = proj.fidelity_summary()
+        self.assertEqual(summary["abaqus"]["count"], 2)
+        self.assertEqual(summary["cheap"]["count"], 3)
+
+        # 近似计算收敛后提前用abaqus校核
+        proj = self.fake_project("converged", step_factor=0.3, iter_times=4, verify_every=10, cheap_tol=10.0,
+                                 cheap_solver=FakeProject.fake_result)
+        proj.run(self.pt_list)
+        fidelities = [record["fidelity"] for record in proj.history]
+        self.assertEqual(fidelities, ["abaqus", "cheap", "cheap", "abaqus"])
+
+    def test_d_stop_criteria(self):
+        self.assertIsNone(StopCriteria().check([0.3, 0.2, 0.1], 1e6))
+        stop = StopCriteria(stderr_tol=0.1)
+        self.assertIsNone(stop.check([0.3, 0.2], 0.0))
+        self.assertIsNotNone(stop.check([0.3, 0.1], 0.0))
+        self.assertIsNone(stop.check([0.3, 0.1], 0.0, fidelity="cheap"))
+        stop = StopCriteria(window=2, min_improvement=0.05)
+        self.assertIsNone(stop.check([0.3, 0.2], 0.0))
+        self.assertIsNone(stop.check([0.3, 0.2, 0.25, 0.15], 0.0))
+        # 振荡
+        self.assertIsNotNone(stop.check([0.3, 0.2, 0.25, 0.2, 0.22], 0.0))
+        stop = StopCriteria(patience=3)
+        self.assertIsNone(stop.check([0.3, 0.2, 0.21, 0.22], 0.0))
+        self.assertIsNotNone(stop.check([0.3, 0.2, 0.21, 0.22, 0.19, 0.2, 0.2, 0.2], 0.0))
+        self.assertIsNotNone(StopCriteria(max_wall_time=60).check([0.3], 61.0))
+
+    def test_d_stop_criteria_mixed_fidelity(self):
+        # 近似计算的bound_stderr比abaqus的小很多, 不能算作abaqus的改善, 也不能让abaqus的结果显得没有改善
+        mixed = {"cheap": [0.05, 0.04, 0.04, 0.04], "abaqus": [0.3, 0.2, 0.15]}
+        stop = StopCriteria(window=2, min_improvement=0.05)
+        self.assertIsNone(stop.check(mixed, 0.0, fidelity="abaqus"))
+        self.assertIsNone(stop.check(mixed, 0.0, fidelity="cheap"))
+        mixed["abaqus"].extend([0.16, 0.17])
+        self.assertIsNotNone(stop.check(mixed, 0.0, fidelity="abaqus"))
+        stop = StopCriteria(patience=2)
+        mixed = {"cheap": [0.05, 0.06, 0.07, 0.08, 0.09], "abaqus": [0.3, 0.2]}
+        self.assertIsNone(stop.check(mixed, 0.0, fidelity="cheap"))
+        self.assertIsNone(stop.check(mixed, 0.0, fidelity="abaqus"))
+        mixed["abaqus"].extend([0.25, 0.22])
+        self.assertIsNotNone(stop.check(mixed, 0.0, fidelity="abaqus"))
+        self.assertIsNone(StopCriteria(stderr_tol=0.1).check(mixed, 0.0, fidelity="abaqus"))
+
+        # 在Project中近似计算和abaqus交替时, 只按abaqus的迭代计数
+        def cheap_solver(d):
+            d = FakeProject.fake_result(d)
+            d['bound_stderr'] *= 0.01
+            return d
+
+        proj = self.fake_project("mixed", step_factor=0.3, iter_times=7, verify_every=3, cheap_tol=0.0,
+                                 cheap_solver=cheap_solver, stop_criteria=StopCriteria(patience=3))
+        proj.run(self.pt_list)
+        fidelities = [record["fidelity"] for record in proj.history]
+        self.assertEqual(fidelities, ["abaqus", "cheap", "cheap", "abaqus", "cheap", "cheap", "abaqus"])
+        self.assertIsNone(proj.stop_reason)
+
+    def test_e_early_stop_returns_best(self):
+        proj = self.fake_project("stop", step_factor=0.3, iter_times=250, stop_criteria=StopCriteria(patience=2))
+        best = proj.run(self.pt_list)
+        self.assertLess(len(proj.history), 250)
+        self.assertIsNotNone(proj.stop_reason)
+        stderrs = [record["bound_stderr"] for record in proj.history]
+        self.assertEqual(proj.best["bound_stderr"], min(stderrs))
+        self.assertIs(best, proj.best["pt_list"])
+
+        proj = self.fake_project("wall", iter_times=250, stop_criteria=StopCriteria(max_wall_time=0.0))
+        self.assertEqual(proj.run(self.pt_list), self.pt_list)
+        self.assertEqual(len(proj.history), 1)
+
+    def test_f_result_cache(self):
+        cache_dir = self.json_path + "/cache"
+        first = self.fake_project("first", iter_times=1, cache_dir=cache_dir)
+        first.run(self.pt_list)
+        second = self.fake_project("second", iter_times=1, cache_dir=cache_dir)
+        second.run(self.pt_list)
+        self.assertEqual(first.max_running, 1)
+        self.assertEqual(second.max_running, 0)
+        self.assertEqual(second.cache.stats(), {"hits": 1, "misses": 0, "entries": 1})
+        self.assertTrue(second.history[0]["cached"])
+        self.assertEqual(second.history[0]["bound_stderr"], first.history[0]["bound_stderr"])
+
+    def test_g_checkpoint_resume(self):
+        random_seed(1)
+        full = self.fake_project("full", step_factor=0.3, iter_times=4, enable_rand=True)
+        full_best = full.run(self.pt_list)
+
+        random_seed(1)
+        part = self.fake_project("part", step_factor=0.3, iter_times=2, enable_rand=True)
+        part.run(self.pt_list)
+        self.assertTrue(os.path.exists(self.json_path + "/part.checkpoint.json"))
+        self.assertFalse(os.path.exists(self.json_path + "/part.checkpoint.json.tmp"))
+        # 模拟重启: 新的进程中随机数状态不同
+        random_seed(2)
+        resumed = self.fake_project("part", step_factor=0.3, iter_times=4, enable_rand=True)
+        resumed_best = resumed.run(self.pt_list, resume=True)
+        self.assertEqual(resumed.max_running, 1)
+        self.assertEqual([record["time"] for record in resumed.history], [0, 1, 2, 3])
+        self.assertEqual([record["bound_stderr"] for record in resumed.history],
+                         [record["bound_stderr"] for record in full.history])
+        self.assertEqual(resumed_best, full_best)
+
+        # 已经完成的迭代不再计算
+        again = self.fake_project("part", step_factor=0.3, iter_times=4, enable_rand=True)
+        self.assertEqual(again.run(self.pt_list, resume=True), full_best)
+        self.assertEqual(again.max_running, 0)
+
+    def test_h_binary(self):
+        proj = self.fake_project("binary", iter_times=2, binary=True, plot_every=2)
+        proj.run(self.pt_list)
+        self.assertTrue(os.path.exists(self.json_path + "/binary-1st-1.npz"))
+        self.assertTrue(os.path.exists(self.json_path + "/binary-0.png"))
+        self.assertFalse(os.path.exists(self.json_path + "/binary-1.png"))
+        d = load_data(self.json_path + "/binary-2nd-1.npz")
+        self.assertEqual(d['odb_name'], "binary-1")
+        self.assertEqual(len(d['incoord_3d']), len(d['incoord']))
+
+        # LinearFrame近似计算的结果同样保存为npz
+        abq_name, tmp_2nd_name = proj.prepare(self.pt_list, 2)
+        d = proj.solve_cheap(tmp_2nd_name, abq_name)
+        self.assertFalse(os.path.exists(self.json_path + "/res_binary-2.json"))
+        self.assertEqual(load_data(self.json_path + "/res_binary-2.npz")['bound_stderr'], d['bound_stderr'])
+
+    def test_i_incremental(self):
+        stderrs = []
+        for incremental, root_method in ((False, "scan"), (True, "scan"), (True, "ppoly")):
+            random_seed(1)
+            proj = self.fake_project("inc", iter_times=3, plot_every=None,
+                                     incremental=incremental, root_method=root_method)
+            proj.iterate(self.pt_list)
+            self.assertEqual(proj.last_plain.root_method, root_method)
+            stderrs.append([record["bound_stderr"] for record in proj.history])
+        self.assertEqual(len(stderrs[0]), len(stderrs[1]))
+        for a, b in zip(*stderrs[:2]):
+            self.assertAlmostEqual(a, b, places=9)
+        # 两种求根方法的端点只在1e-6以内相同, 迭代后布置会逐渐不同, 只比较第一次
+        self.assertAlmostEqual(stderrs[0][0], stderrs[2][0], places=6)
+
+        # population模式中每个候选布置都在上一次选中的候选的基础上增量生成
+        class PreviousRecorder(FakeProject):
+            def prepare(self, pts, time, suffix=""):
+                previous.append((time, self.last_plain.pt_list if self.last_plain is not None else None))
+                return super(PreviousRecorder, self).prepare(pts, time, suffix)
+
+            def finish_iteration(self, state, time, pts, d, fidelity, start):
+                chosen[time] = sorted(pts)
+                return super(PreviousRecorder, self).finish_iteration(state, time, pts, d, fidelity, start)
+
+        previous, chosen = [], {}
+        proj = self.fake_project("inc-population", cls=PreviousRecorder,
+                                 step_factor=0.3, iter_times=3, plot_every=None, incremental=True,
+                                 population=3, cpu_budget=12)
+        proj.iterate(self.pt_list)
+        # 第一次迭代只有初始的布置
+        self.assertEqual(len(previous), 1 + 3 + 3)
+        for time, pts in previous:
+            self.assertEqual(pts, chosen.get(time - 1))
+        self.assertEqual(proj.last_plain.pt_list, chosen[2])
 
-        proj.run(pt_list)
+    def test_j_metrics(self):
+        received = []
+        proj = self.fake_project("metrics", iter_times=2, plot_every=None, metrics_sink=received.append)
+        proj.run(self.pt_list)
+        with open(self.json_path + "/metrics.metrics.jsonl", "r") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines, received)
+        self.assertEqual([line["time"] for line in lines], [0, 1])
+        for line, record in zip(lines, proj.history):
+            self.assertEqual(line["event"], "iteration")
+            self.assertEqual(line["bound_stderr"], record["bound_stderr"])
+            self.assertGreater(line["counters"]["members"], 0)
+            self.assertGreater(line["counters"]["inner_nodes"], 0)
+            self.assertGreater(line["counters"]["bytes_written"], 0)
+            for stage in ("layout", "write", "solve_abaqus"):
+                self.assertIn(stage, line["stages"])
+            self.assertGreater(line["counters"]["pairs"], 0)
+            self.assertIn("iteration", line["stages"])
 
     def tearDown(self):
+        shutil.rmtree(self.json_path, ignore_errors=True)
         super().tearDown()
 
 
@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.utils import *
+
+
+class FrameSolverTest(unittest.TestCase):
+    def setUp(self):
+        super(FrameSolverTest, self).setUp()
+        self.json_path = tempfile.mkdtemp()
+        test = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        d_1st = InitPlain(test).to_json(file_name="frame-1st.json", save_path=self.json_path)
+        self.d_2nd = GenerateAbaqusData.to_json(
+            d_in=d_1st,
+            json_file_name="frame-2nd.json",
+            json_save_dir=self.json_path,
+            abaqus_dir=self.json_path,
+            mdb_name="frame",
+            odb_name="frame",
+            iter_time=0,
+            left_hang=10,
+            left_hang_height=5,
+            right_hang=30,
+            right_hang_height=5,
+            radius=0.02,
+            thickness=0.003,
+            elastic_modular=26E+09,
+            density=1850,
+            deformation_step_name="Step-1",
+            res_file_prefix="res_"
+        )
+
+    def test_a_frame_stiffness(self):
+        k = frame_stiffness(26E+09, 1E+10, 3E-04, 6E-08, 1.2E-07, [1.0, 2.5])
+        self.assertTrue(np.allclose(k, k.transpose(0, 2, 1)))
+        # 刚体平动和绕z轴的刚体转动不产生内力
+        rigid_z = np.array([0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0], float)
+        self.assertTrue(np.allclose(k[0].dot(rigid_z), 0))
+        rot_z = np.array([0, 0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 1], float)
+        self.assertTrue(np.allclose(k[0].dot(rot_z), 0))
+
+    def test_b_solve_matches_post_format(self):
+        d = LinearFrame.to_json(self.d_2nd)
+        with open(self.json_path + "/res_frame.json", "r") as f:
+            self.assertEqual(json.load(f)['bound_stderr'], d['bound_stderr'])
+        self.assertTrue(all(len(p) == 6 for p in d['bound_pts'] + d['inner_pts']))
+        self.assertEqual(len(d['inner_pts']), len(self.d_2nd['incoord']))
+        self.assertAlmostEqual(d['bound_stderr'], np.std([p[5] for p in d['bound_pts']]))
+
+        # 结构和荷载关于x轴对称, 变形也应对称
+        z = dict(((round(p[0], 6), round(p[1], 6)), p[5]) for p in d['bound_pts'] + d['inner_pts'])
+        for (x, y), val in z.items():
+            self.assertAlmostEqual(val, z.get((x, -y), val), places=5)
+
+        new_points = Iteration(d, factor=0.3, seed=1).get_new_points()
+        self.assertEqual(new_points[0][1], 0.0)
+
+    def test_c_cantilever(self):
+        # 悬臂梁端部受集中力P: 挠度PL^3/3EI, 转角PL^2/2EI; 轴力PL/EA; 扭矩TL/GJ
+        E, G, A, I, J, L, P = 26E+09, 1E+10, 3E-04, 6E-08, 1.2E-07, 2.5, 100.0
+        k = frame_stiffness(E, G, A, I, J, [L])[0]
+        free = np.arange(6, 12)
+        f = np.array([P, P, P, P, 0.0, 0.0])
+        u = np.linalg.solve(k[np.ix_(free, free)], f)
+        self.assertAlmostEqual(u[0], P * L / (E * A))
+        self.assertAlmostEqual(u[1], P * L ** 3 / (3 * E * I))
+        self.assertAlmostEqual(u[2], P * L ** 3 / (3 * E * I))
+        self.assertAlmostEqual(u[3], P * L / (G * J))
+        self.assertAlmostEqual(u[4], -P * L ** 2 / (2 * E * I))
+        self.assertAlmostEqual(u[5], P * L ** 2 / (2 * E * I))
+
+    def test_d_load_middle(self):
+        # u1约束在pre.py中Set-loadMiddle的位置
+        frame = LinearFrame(self.d_2nd)
+        fixed, values = frame.boundary_conditions()
+        u1 = [i for i, dofs in enumerate(frame.dofs) if dofs[0] in set(fixed)]
+        self.assertEqual(set(frame.coords[i] for i in u1), {(LOAD_MIDDLE_X, 0.0, 0.0)})
+
+    def test_e_binary_result(self):
+        # 输入为npz时结果也保存为npz, 只保存新增的字段和对输入文件的引用
+        input_file = self.json_path + "/frame-2nd.npz"
+        save_data(input_file, self.d_2nd)
+        d = LinearFrame.to_json(self.d_2nd, input_file=input_file)
+        self.assertFalse(os.path.exists(self.json_path + "/res_frame.json"))
+        with np.load(self.json_path + "/res_frame.npz") as data:
+            self.assertNotIn('incoord_3d', data.files)
+        d_res = load_data(self.json_path + "/res_frame.npz")
+        self.assertEqual(d_res['input'], "frame-2nd.npz")
+        self.assertEqual(d_res['incoord_3d'], load_data(input_file)['incoord_3d'])
+        self.assertEqual(d_res['bound_pts'], d['bound_pts'])
+
+    def tearDown(self):
+        shutil.rmtree(self.json_path)
+        super(FrameSolverTest, self).tearDown()
+
+
+if __name__ == '__main__':
+    unittest.main()
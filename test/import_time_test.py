@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只有用到绘图、插值和求解器时才应该导入的包
+HEAVY_PACKAGES = ('matplotlib', 'scipy')
+# 不应该导入HEAVY_PACKAGES的模块
+LIGHT_MODULES = ('src.utils.run_abaqus', 'src.utils.iter', 'src.utils.result_cache')
+
+
+class ImportTimeTest(unittest.TestCase):
+    @classmethod
+    def run_python(cls, *args):
+        return subprocess.run([sys.executable] + list(args), cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    @classmethod
+    def heavy_modules(cls, statement):
+        code = "import sys\n%s\nprint(' '.join(m for m in sys.modules if m.split('.')[0] in %r))" % (
+            statement, HEAVY_PACKAGES)
+        return cls.run_python("-c", code).stdout.split()
+
+    def test_a_lazy_package(self):
+        self.assertEqual(self.heavy_modules("from src.utils import RunAbaqus, ResultCache, load_data"), [])
+        self.assertEqual(self.heavy_modules("from src.utils import Iteration"), [])
+        self.assertNotEqual(self.heavy_modules("from src.utils import InitPlain"), [])
+
+    def test_b_all_names_resolve(self):
+        import src.utils
+        from importlib import import_module
+        for name in src.utils.__all__:
+            module = import_module("src.utils." + src.utils._MODULE_OF[name])
+            self.assertIs(getattr(src.utils, name), getattr(module, name))
+        with self.assertRaises(AttributeError):
+            getattr(src.utils, "no_such_name")
+
+    def test_c_light_modules(self):
+        # 检查导入了哪些包, 而不是导入用时, 结果与机器的快慢无关
+        self.assertEqual(self.heavy_modules("import src.utils"), [])
+        for module in LIGHT_MODULES:
+            self.assertEqual(self.heavy_modules("import %s" % module), [], module)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.utils import *
+
+
+class InterchangeTest(unittest.TestCase):
+    def setUp(self):
+        super(InterchangeTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.pt_list = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+
+    def generate(self, ext):
+        plain = InitPlain(self.pt_list)
+        d_1st = plain.to_json(file_name="plain-1st" + ext, save_path=self.tmp)
+        GenerateAbaqusData.to_json(
+            d_in=d_1st, json_file_name="plain-2nd" + ext, res_file_prefix="res_", json_save_dir=self.tmp,
+            abaqus_dir=self.tmp, mdb_name="plain", odb_name="plain", iter_time=0,
+            left_hang=10, left_hang_height=5, right_hang=30, right_hang_height=5,
+            radius=0.02, thickness=0.003, elastic_modular=26E+09, density=1850, deformation_step_name="Step-1",
+        )
+        return self.tmp + "/plain-2nd" + ext
+
+    def test_a_npz_matches_json(self):
+        d_json = load_data(self.generate(".json"))
+        d_npz = load_data(self.generate(".npz"))
+        self.assertEqual(sorted(d_json.keys()), sorted(d_npz.keys()))
+        for k in d_json:
+            self.assertEqual(d_json[k], d_npz[k], k)
+        self.assertEqual(load_data(self.tmp + "/plain-1st.json"), load_data(self.tmp + "/plain-1st.npz"))
+
+    def test_b_result_references_input(self):
+        input_file = self.generate(".npz")
+        d_in = load_data(input_file)
+        d = LinearFrame(d_in).solve()
+        save_result(self.tmp + "/res_plain.npz", d_in, d, input_file)
+        with np.load(self.tmp + "/res_plain.npz") as data:
+            self.assertNotIn('incoord_3d', data.files)
+            self.assertIn('bound_pts', data.files)
+        d_res = load_data(self.tmp + "/res_plain.npz")
+        self.assertEqual(d_res['input'], "plain-2nd.npz")
+        self.assertEqual(d_res['incoord_3d'], d_in['incoord_3d'])
+        self.assertEqual(d_res['bound_pts'], d['bound_pts'])
+
+        save_result(self.tmp + "/res_plain.json", d_in, d, self.tmp + "/plain-2nd.json")
+        a = Iteration.from_file(self.tmp + "/res_plain.json", factor=0.3, seed=1)
+        b = Iteration.from_file(self.tmp + "/res_plain.npz", factor=0.3, seed=1)
+        self.assertEqual(a.get_new_points(), b.get_new_points())
+
+    def test_c_numpy_scalars_in_header(self):
+        # json格式能保存的numpy标量在npz的头中也要能保存
+        d = {'iter_time': np.int64(3), 'bound_stderr': np.float64(0.25), 'hang': np.array([10, 30]),
+             'xcoord': [[(0.0, 1.0), (2.0, 3.0)]]}
+        for ext in (".json", ".npz"):
+            save_data(self.tmp + "/scalars" + ext, d)
+            loaded = load_data(self.tmp + "/scalars" + ext)
+            self.assertEqual(loaded['iter_time'], 3)
+            self.assertEqual(loaded['bound_stderr'], 0.25)
+            self.assertEqual(loaded['hang'], [10, 30])
+        self.assertEqual(load_data(self.tmp + "/scalars.npz")['xcoord'], [[[0.0, 1.0], [2.0, 3.0]]])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        super(InterchangeTest, self).tearDown()
+
+
+if __name__ == '__main__':
+    unittest.main()
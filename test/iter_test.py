@@ -1,6 +1,9 @@
 import unittest
 
+import numpy as np
+
 from src.utils.iter import *
+from src.utils.utils import InitPlain
 
 
 class IterTest(unittest.TestCase):
@@ -29,6 +32,78 @@ class IterTest(unittest.TestCase):
         new_plain.to_json("iter6.json", save_path=odb_file_path)
         new_plain.plot_xy()
 
+    @staticmethod
+    def synthetic_result(pt_list):
+        # 用平面布置构造odb结果格式的边界点和内部点, z取一个光滑的假想位移
+        plain = InitPlain(pt_list)
+        bound = [p for pair in plain.xcoord + plain.ycoord for p in pair]
+        to_odb = lambda p: (p[0], p[1], 0.0, p[0], p[1], -0.01 * p[0] + 0.02 * abs(p[1]))
+        return {
+            'bound_pts': [to_odb(p) for p in bound],
+            'inner_pts': [to_odb(p) for p in plain.incoord],
+        }
+
+    def test_c_get_b_in_pairs(self):
+        d = self.synthetic_result([(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)])
+        pts_b = sorted(d['bound_pts'], key=itemgetter(0))
+        pts_in = sorted(d['inner_pts'], key=itemgetter(0))
+        expected = []
+        for p_b in pts_b:
+            for p_in in pts_in:
+                if Distance.abs(p_b[:3], p_in[:3]) <= 1.0:
+                    expected.append((p_b, p_in))
+        pairs = Iteration.get_b_in_pairs(pts_b, pts_in)
+        self.assertEqual(pairs[:len(expected)], expected)
+
+        sym_b = sorted([p for p in pts_b if p[1] == 0.0], key=itemgetter(0))
+        sym_in = sorted([p for p in pts_in if p[1] == 0.0], key=itemgetter(0))
+        self.assertEqual(Iteration.get_sym_pt_pair(pts_b, pts_in),
+                         [(sym_b[0], sym_in[0]), (sym_b[-1], sym_in[-1])])
+
+    def test_d_reduce_pts(self):
+        d = self.synthetic_result([(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)])
+        it = Iteration(d, factor=0.3, seed=7)
+        self.assertEqual(it.reduce_pts(seed=7), it.new_points)
+
+        # 与逐点比较的实现在相同的顺序下结果一致
+        pts = [p for p in it.raw_points_dict.values() if p[1] >= 0.0]
+        pts = Iteration.filter_start_from_zero(pts)
+        Random(7).shuffle(pts)
+        expected = []
+        for p1 in pts:
+            if p1[1] == 0.0 or all(Distance.euclidean(p1, p2) > 1.0 for p2 in expected):
+                expected.append(p1)
+        expected.sort(key=itemgetter(0))
+        self.assertEqual(it.new_points, expected)
+
+    def test_e_adjust_by_z_batch(self):
+        d = self.synthetic_result([(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)])
+        pairs = Iteration.get_b_in_pairs(d['bound_pts'], d['inner_pts'])
+        # 会被限制在对称轴两侧0.05处的y向点对
+        pairs += [((5, 0.3, 0, 5, 0.3, 0.1), (5, 1.3, 0, 5, 1.3, 0.0)),
+                  ((6, 1.3, 0, 6, 1.3, -5.0), (6, 0.3, 0, 6, 0.3, 0.0))]
+        pts_b = [p_b for p_b, _ in pairs]
+        pts_in = [p_in for _, p_in in pairs]
+        for avg_z in (0.0, 0.2, -5.0):
+            batch = Iteration.adjust_by_z_batch(pts_b, pts_in, avg_z, factor=0.3)
+            if avg_z == 0.0:
+                self.assertEqual(batch[-2:, 1].tolist(), [-0.05, 0.05])
+            scalar = [Iteration.adjust_by_z(p_b, p_in, avg_z, factor=0.3) for p_b, p_in in pairs]
+            self.assertEqual([tuple(p) for p in batch.tolist()], scalar)
+
+            # 用相同的随机数时与逐点的结果一致
+            batch = Iteration.adjust_by_z_batch(pts_b, pts_in, avg_z, factor=0.3, rng=np.random.default_rng(3))
+            draws = np.random.default_rng(3).random(len(pairs)).tolist()
+            scalar = [Iteration.adjust_by_z(p_b, p_in, avg_z, factor=0.3, enable_rand=True, rand_value=u)
+                      for (p_b, p_in), u in zip(pairs, draws)]
+            self.assertEqual([tuple(p) for p in batch.tolist()], scalar)
+
+        with self.assertRaises(Exception):
+            Iteration.adjust_by_z_batch([(0, 0, 0, 0, 0, 0)], [(1, 1, 0, 1, 1, 0)], 0.0)
+
+        it = Iteration(d, factor=0.3, enable_rand=True, seed=5)
+        self.assertEqual(Iteration(d, factor=0.3, enable_rand=True, seed=5).new_points, it.new_points)
+
     def tearDown(self):
         super(IterTest, self).tearDown()
 
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from src.utils import *
+
+
+class LayoutTest(unittest.TestCase):
+    def setUp(self):
+        super(LayoutTest, self).setUp()
+        test = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        self.plain = InitPlain(test)
+        self.layout = self.plain.layout
+
+    def test_a_views(self):
+        layout = self.layout
+        self.assertEqual(layout.xcoord.shape[1:], (2, 2))
+        self.assertEqual(layout.incoord.shape[1:], (2,))
+        self.assertEqual(layout.xcoord_3d.shape, (2 * len(layout.xcoord), 3))
+        self.assertTrue(np.shares_memory(layout.xcoord, layout.xcoord_3d))
+        self.assertTrue(np.shares_memory(layout.incoord, layout.incoord_3d))
+        self.assertTrue(np.all(layout.ycoord_3d[:, 2] == 0.0))
+
+        members, directions = layout.members()
+        self.assertEqual(directions.dtype, DIRECTION_DTYPE)
+        self.assertEqual(len(members), len(layout.xcoord) + len(layout.ycoord))
+        self.assertEqual(int((directions == DIRECTION_X).sum()), len(layout.xcoord))
+
+    def test_b_to_dict(self):
+        d = self.layout.to_dict()
+        self.assertEqual(d['xcoord'], [[list(p) for p in pair] for pair in self.plain.xcoord])
+        self.assertEqual(d['incoord'], [list(p) for p in self.plain.incoord])
+        self.assertEqual(d['left_bound'], 0)
+        again = Layout.from_dict(d)
+        self.assertTrue(np.array_equal(again.ycoord, self.layout.ycoord))
+        empty = Layout([], [], [], 0.0, 1.0)
+        self.assertEqual(empty.xcoord_3d.shape, (0, 3))
+        self.assertEqual(empty.to_dict()['incoord'], [])
+
+    def test_c_abaqus_data_views(self):
+        import shutil
+        import tempfile
+        save_path = tempfile.mkdtemp()
+        try:
+            d = GenerateAbaqusData.to_json(
+                d_in=self.layout, json_file_name="layout-2nd", res_file_prefix="res_", json_save_dir=save_path,
+                abaqus_dir=save_path, mdb_name="layout", odb_name="layout", iter_time=0,
+                left_hang=10, left_hang_height=5, right_hang=30, right_hang_height=5,
+                radius=0.02, thickness=0.003, elastic_modular=26E+09, density=1850, deformation_step_name="Step-1",
+            )
+            self.assertTrue(np.shares_memory(d['incoord_3d'], self.layout.incoord))
+            loaded = load_data(save_path + "/layout-2nd.json")
+            self.assertEqual(loaded['incoord_3d'], [list(p) for p in GenerateAbaqusData.to_3d_inner(self.plain.incoord)])
+            self.assertEqual(loaded['xcoord_3d'], [list(p) for p in GenerateAbaqusData.to_3d_xy(self.plain.xcoord)])
+        finally:
+            shutil.rmtree(save_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
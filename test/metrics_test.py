@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from src.utils.metrics import *
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "metrics.jsonl")
+
+    def read_lines(self):
+        with open(self.path, "r") as f:
+            return [json.loads(line) for line in f]
+
+    def test_a_record(self):
+        received = []
+        metrics = Metrics(self.path, sink=received.append)
+        record = metrics.record("iteration", time=3)
+        for _ in range(2):
+            with record.stage("layout"):
+                pass
+        threads = [threading.Thread(target=record.count, args=("members", 5)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        record.set("bound_stderr", np.float64(0.5))
+        record.emit()
+        metrics.write({"event": "script", "wall_time": 1.0})
+
+        lines = self.read_lines()
+        self.assertEqual(lines, received)
+        self.assertEqual([line["event"] for line in lines], ["iteration", "script"])
+        self.assertEqual(lines[0]["time"], 3)
+        self.assertEqual(lines[0]["counters"], {"members": 20})
+        self.assertEqual(list(lines[0]["stages"]), ["layout"])
+        self.assertEqual(lines[0]["bound_stderr"], 0.5)
+        self.assertIn("timestamp", lines[1])
+
+    def test_b_disabled_and_bad_sink(self):
+        metrics = Metrics()
+        self.assertFalse(metrics.enabled)
+        metrics.record("iteration").emit()
+        self.assertFalse(os.path.exists(self.path))
+
+        def bad_sink(record):
+            raise ValueError("sink is down")
+
+        metrics = Metrics(self.path, sink=bad_sink)
+        metrics.record("iteration").emit()
+        self.assertEqual(len(self.read_lines()), 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        super(MetricsTest, self).tearDown()
+
+
+if __name__ == '__main__':
+    unittest.main()
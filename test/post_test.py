@@ -0,0 +1,179 @@
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+import numpy as np
+
+# post.py只能在abaqus中运行, 这里用空模块代替abaqus的odbAccess和abaqusConstants
+for name in ("odbAccess", "abaqusConstants"):
+    sys.modules.setdefault(name, types.ModuleType(name))
+
+from abaqus_api import post
+from abaqus_api.interchange import load_data
+
+ERR = 0.0002
+
+
+class Node(object):
+    def __init__(self, label, coordinates):
+        self.label = label
+        self.coordinates = tuple(coordinates)
+
+
+class Instance(object):
+    # 记录读取nodes的次数, 检查节点数组是否只建一次
+    def __init__(self, name, coordinates):
+        self.name = name
+        self._nodes = [Node(k + 1, c) for k, c in enumerate(coordinates)]
+        self.reads = 0
+
+    @property
+    def nodes(self):
+        self.reads += 1
+        return self._nodes
+
+
+class FieldValue(object):
+    def __init__(self, instance, nodeLabel, data):
+        self.instance = instance
+        self.nodeLabel = nodeLabel
+        # 与bulkDataBlocks一样是单精度的
+        self.data = np.asarray(data, dtype=np.float32)
+
+
+class Block(object):
+    def __init__(self, instance, nodeLabels, data):
+        self.instance = instance
+        self.nodeLabels = np.asarray(nodeLabels, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float32)
+
+
+class FieldOutput(object):
+    """按instance分块的位移场, 每块内节点按给定的顺序排列。"""
+
+    def __init__(self, entries):
+        # entries: [(instance, label, (u1, u2, u3))], instance为None表示connector
+        self.entries = entries
+
+    @property
+    def values(self):
+        return [FieldValue(instance, label, data) for instance, label, data in self.entries]
+
+    @property
+    def bulkDataBlocks(self):
+        blocks = []
+        for entry in self.entries:
+            if blocks and blocks[-1][0] is entry[0]:
+                blocks[-1][1].append(entry)
+            else:
+                blocks.append((entry[0], [entry]))
+        return [Block(instance, [e[1] for e in entries], [e[2] for e in entries]) for instance, entries in blocks]
+
+    def getSubset(self, region):
+        return FieldOutput([e for e in self.entries if e[0] is not None and (e[0].name, e[1]) in region])
+
+
+class Odb(object):
+    def __init__(self, fieldOutput, nodeSets):
+        frame = types.SimpleNamespace(fieldOutputs={'U': fieldOutput})
+        self.steps = {'Step-1': types.SimpleNamespace(frames=[frame])}
+        self.rootAssembly = types.SimpleNamespace(nodeSets=nodeSets)
+
+
+class PostTest(unittest.TestCase):
+    def setUp(self):
+        super(PostTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        # 边界点: 负坐标、同一个桶中的近似重复点, 以及落在桶边上的点
+        self.bound = [(-3.25, -1.5, 0.0), (-3.25001, -1.50004, 0.0), (0.1, 0.0001, 0.0), (0.10005, 0.00012, 0.0),
+                      (2.0, -0.0001, 0.0), (ERR * 10, ERR * 20, 0.0),
+                      (1.00001, 1.00001, 0.0), (1.00005, 1.00002, 0.0), (1.00009, 1.00003, 0.0)]
+        self.bound += [(x, y, 0.0) for x, y in rng.uniform(-20, 20, (40, 2)).round(3).tolist()]
+        self.inner = [(float(x), float(y), 0.0) for x in range(-4, 5) for y in range(-3, 4)]
+        # 节点: 与边界点和内部点重合、在err以内、刚好在err以外, 以及不相干的点
+        offsets = [(0.0, 0.0), (0.4 * ERR, 0.0), (0.0, -0.45 * ERR), (0.3 * ERR, 0.3 * ERR),
+                   (0.6 * ERR, 0.6 * ERR), (-ERR, 0.0), (0.0, 1.01 * ERR)]
+        nodes = []
+        for k, p in enumerate(self.bound + self.inner):
+            dx, dy = offsets[k % len(offsets)]
+            nodes.append((p[0] + dx, p[1] + dy, 0.0))
+        nodes += [(x, y, 0.0) for x, y in rng.uniform(-20, 20, (60, 2)).tolist()]
+        nodes += [(0.5, -0.5, 0.0), (-1.0, 0.5, 0.0)]
+        self.nodes = nodes
+
+        half = len(nodes) // 2
+        self.instances = [Instance("PARTA-1", nodes[:half]), Instance("PARTB-1", nodes[half:])]
+        entries = []
+        for instance in self.instances:
+            labels = [node.label for node in instance._nodes]
+            # odb中块内的节点不一定按label排序
+            rng.shuffle(labels)
+            entries += [(instance, label, tuple(rng.uniform(-0.1, 0.1, 3).tolist())) for label in labels]
+            entries.append((None, 1, (0.0, 0.0, 0.0)))
+        self.fieldOutput = FieldOutput(entries)
+
+    def test_a_mask_matches_scan(self):
+        coordinates = np.asarray(self.nodes)
+        for pointLst in (self.bound, self.inner, self.bound + self.inner):
+            expected = [post.isSetPoints(c, pointLst) for c in self.nodes]
+            self.assertEqual(post.isSetPointsMask(coordinates, pointLst).tolist(), expected)
+        self.assertEqual(post.isSetPointsMask(coordinates, []).tolist(), [False] * len(self.nodes))
+        # 近似重复的点在同一个桶中, 分层后都要能找到
+        dup = [(1.00001, 1.00001, 0.0), (1.00005, 1.00002, 0.0), (1.00009, 1.00003, 0.0)]
+        query = np.asarray([(1.00009 + 0.9 * ERR, 1.00003, 0.0), (1.00001 - 0.9 * ERR, 1.00001, 0.0)])
+        self.assertEqual(post.isSetPointsMask(query, dup).tolist(), [True, True])
+
+    def test_b_bulk_matches_values(self):
+        bound, inner = post.bulkDeformation(self.fieldOutput, self.bound, self.inner)
+        expected_bound, expected_inner = post.valuesDeformation(self.fieldOutput, self.bound, self.inner)
+        self.assertGreater(len(expected_bound), 0)
+        self.assertGreater(len(expected_inner), 0)
+        for rows, expected in ((bound, expected_bound), (inner, expected_inner)):
+            self.assertEqual(len(rows), len(expected))
+            self.assertTrue(np.allclose(sorted(rows), sorted(expected), rtol=0, atol=1e-12))
+
+    def test_c_subsets_share_node_cache(self):
+        # pre.py中建立的集合: 边界点和内部点分别按instance划分
+        bound_mask = post.isSetPointsMask(np.asarray(self.nodes), self.bound)
+        nodeSets = {}
+        for k, name in enumerate(post.OUTPUT_SET_NAMES):
+            instance = self.instances[k % 2]
+            is_bound = k < 2
+            nodeSets[name.upper()] = set((instance.name, node.label) for node in instance._nodes
+                                         if bound_mask[self.nodes.index(node.coordinates)] == is_bound)
+        odb = Odb(self.fieldOutput, nodeSets)
+        d_in = {'mdb_name': "post", 'odb_name': "post", 'left_hang_height': 5, 'left_hang': 10,
+                'right_hang_height': 5, 'right_hang': 30, 'xcoord': [], 'ycoord': [], 'incoord': [],
+                'xcoord_3d': self.bound, 'ycoord_3d': [], 'incoord_3d': self.inner, 'vector': [0, 0, 1],
+                'radius': 0.02, 'thickness': 0.003, 'elastic_modular': 26E+09, 'density': 1850,
+                'json_save_dir': self.tmp, 'res_file_prefix': "res_"}
+
+        results = {}
+        for bulk in (True, False):
+            for subset in (True, False):
+                for instance in self.instances:
+                    instance.reads = 0
+                post.get_node_deformation(odb, d_in, "Step-1", bulk=bulk, subset=subset)
+                results[bulk, subset] = load_data(self.tmp + "/res_post.json")
+                if bulk:
+                    # 4个子集共用一个缓存, 每个instance的节点只读取一次
+                    self.assertEqual([instance.reads for instance in self.instances], [2, 2])
+        expected = results[False, False]
+        for d in results.values():
+            for key in ('bound_pts', 'inner_pts'):
+                self.assertTrue(np.allclose(sorted(d[key]), sorted(expected[key]), rtol=0, atol=1e-12), key)
+            self.assertAlmostEqual(d['bound_stderr'], expected['bound_stderr'], places=12)
+
+        # odb中没有这些集合时读取整个fieldOutput
+        self.assertEqual(post.outputSubsets(Odb(self.fieldOutput, {}), self.fieldOutput), [self.fieldOutput])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        super(PostTest, self).tearDown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+import unittest
+
+from src.utils import GenerateCoord, QUANTIZE_ACCURACY
+from src.utils.result_cache import *
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        super(ResultCacheTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.d_in = {
+            'odb_name': "a-0",
+            'xcoord': [[[0.0, 1.0], [2.0, 1.0]], [[0.0, 2.0], [2.0, 2.0]]],
+            'ycoord': [[[1.0, 0.0], [1.0, 3.0]]],
+            'incoord': [[1.0, 1.0], [1.0, 2.0]],
+            'radius': 0.02,
+            'elastic_modular': 26E+09,
+        }
+
+    def test_a_key(self):
+        reordered = dict(self.d_in)
+        reordered['odb_name'] = "b-3"
+        reordered['xcoord'] = [[[2.0, 2.0], [0.0, 2.0]], [[0.0, 1.0], [2.0, 1.0 + 1e-9]]]
+        reordered['incoord'] = [[1.0, 2.0], [1.0, 1.0]]
+        self.assertEqual(ResultCache.key(self.d_in), ResultCache.key(reordered))
+        moved = dict(self.d_in)
+        moved['incoord'] = [[1.0, 1.0], [1.0, 2.001]]
+        self.assertNotEqual(ResultCache.key(self.d_in), ResultCache.key(moved))
+        material = dict(self.d_in)
+        material['radius'] = 0.03
+        self.assertNotEqual(ResultCache.key(self.d_in), ResultCache.key(material))
+        # 与生成布置时去重用的量化相同
+        self.assertEqual(ResultCache.quantize(self.d_in['incoord'], QUANTIZE_ACCURACY),
+                         tuple(GenerateCoord.quantize(pt) for pt in self.d_in['incoord']))
+
+    def test_b_get_put(self):
+        cache = ResultCache(self.tmp)
+        self.assertIsNone(cache.get(self.d_in))
+        d = dict(self.d_in)
+        d.update({'bound_pts': [[0.0, 1.0, 0.0, 0.0, 1.0, -0.01]], 'bound_stderr': 0.1})
+        cache.put(self.d_in, d)
+        other = dict(self.d_in)
+        other['odb_name'] = "a-1"
+        hit = cache.get(other)
+        self.assertEqual(hit['odb_name'], "a-1")
+        self.assertEqual(hit['bound_stderr'], 0.1)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
+        self.assertEqual(os.listdir(self.tmp), [ResultCache.key(self.d_in) + ".json"])
+
+    def test_c_evict(self):
+        cache = ResultCache(self.tmp, max_entries=2)
+        inputs = []
+        for i in range(3):
+            d_in = dict(self.d_in)
+            d_in['radius'] = 0.01 * (i + 1)
+            inputs.append(d_in)
+            cache.put(d_in, dict(d_in, bound_stderr=float(i)))
+            # 保证每个条目的使用时间不同
+            path = cache.path(ResultCache.key(d_in))
+            os.utime(path, (1000.0 + i, 1000.0 + i))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(inputs[0]))
+        self.assertEqual(cache.get(inputs[2])['bound_stderr'], 2.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        super(ResultCacheTest, self).tearDown()
+
+
+if __name__ == '__main__':
+    unittest.main()
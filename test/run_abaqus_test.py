@@ -0,0 +1,309 @@
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time as _time
+import unittest
+
+from src.utils.metrics import Metrics
+from src.utils.run_abaqus import *
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "abaqus_api")
+
+# 替身脚本: 读取JSON环境变量指向的文件, 写出一个结果文件
+STAND_IN_SCRIPT = """
+import json, os, time
+json_file = os.environ["JSON"]
+with open(json_file) as f:
+    d = json.load(f)
+time.sleep(d.get("sleep", 0))
+if d.get("fail"):
+    raise Exception("stand-in failure")
+with open(json_file + ".done", "w") as f:
+    f.write(json.dumps({"cwd": os.getcwd()}))
+"""
+
+# 替身的abaqus可执行文件: 启动一个子进程, 输出几行到stdout和stderr后按参数sleep
+FAKE_ABAQUS = """#!/bin/sh
+sleep 60 > /dev/null 2>&1 &
+echo $! > "$JSON.child"
+echo "start $2"
+echo "to stderr" 1>&2
+sleep $(cat "$JSON")
+echo "done"
+exit 3
+"""
+
+# 替身的pre_solve_post脚本: 按JSON中的字段写出状态文件
+STAND_IN_PRE_SOLVE_POST = """
+import json, os
+json_file = os.environ["JSON"]
+with open(json_file) as f:
+    d = json.load(f)
+if not d.get("no_status"):
+    status = {"ok": d["job_status"] == "COMPLETED", "stage": "done" if d["job_status"] == "COMPLETED" else "solve",
+              "job_status": d["job_status"], "error": None, "duration": {}}
+    with open(os.path.splitext(json_file)[0] + ".status.json", "w") as f:
+        f.write(json.dumps(status))
+"""
+
+
+class OneShotRecorder(RunAbaqus):
+    # 记录退回到one-shot方式的调用, 不真正启动abaqus
+    calls = []
+
+    @classmethod
+    def exec_script(cls, abaqus_exe_path, script_path, script_name, json_path, json_file_name, abaqus_dir=os.getcwd(),
+                    timeout=None, log_path=None):
+        cls.calls.append(script_name)
+        return ScriptResult(script_path + "/" + script_name, 0, 0.0, log_path)
+
+
+class RunAbaqusTest(unittest.TestCase):
+    def setUp(self):
+        super(RunAbaqusTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        with open(os.path.join(self.tmp, "stand_in.py"), "w") as f:
+            f.write(STAND_IN_SCRIPT)
+        with open(os.path.join(self.tmp, "stand_in_pre_solve_post.py"), "w") as f:
+            f.write(STAND_IN_PRE_SOLVE_POST)
+        self.abaqus_env = OneShotRecorder(
+            abaqus_dir=self.tmp,
+            abaqus_exe_path="abaqus",
+            script_path=self.tmp,
+            pre_script="stand_in.py",
+            post_script="stand_in.py",
+            pre_solve_post_script="stand_in_pre_solve_post.py",
+        )
+        self.worker_args = [sys.executable, os.path.join(SCRIPT_PATH, "worker.py")]
+        OneShotRecorder.calls = []
+
+    def write_json(self, name, d):
+        with open(os.path.join(self.tmp, name), "w") as f:
+            f.write(json.dumps(d))
+
+    def test_a_worker_runs_scripts(self):
+        worker_dir = os.path.join(self.tmp, "worker")
+        self.assertTrue(self.abaqus_env.start_worker(worker_dir, args=self.worker_args, heartbeat_timeout=5.0))
+        try:
+            for i in range(3):
+                self.write_json("job-%d.json" % i, {})
+                self.assertTrue(self.abaqus_env.pre_process(self.tmp, "job-%d.json" % i))
+                self.assertTrue(os.path.exists(os.path.join(self.tmp, "job-%d.json.done" % i)))
+            self.write_json("bad.json", {"fail": True})
+            self.assertFalse(self.abaqus_env.post_process(self.tmp, "bad.json"))
+        finally:
+            self.abaqus_env.stop_worker()
+        self.assertEqual(OneShotRecorder.calls, [])
+        self.assertFalse(self.abaqus_env.worker_alive())
+
+    def test_b_fall_back_when_worker_dies(self):
+        worker_dir = os.path.join(self.tmp, "worker")
+        self.assertTrue(self.abaqus_env.start_worker(worker_dir, args=self.worker_args, heartbeat_timeout=5.0))
+        self.abaqus_env.worker_process.kill()
+        self.abaqus_env.worker_process.wait()
+        self.write_json("job.json", {})
+        self.assertTrue(self.abaqus_env.pre_process(self.tmp, "job.json"))
+        self.assertEqual(OneShotRecorder.calls, ["stand_in.py"])
+        self.assertEqual([name for name in os.listdir(worker_dir) if name.endswith(".req")], [])
+
+    def test_c_pre_solve_post_status(self):
+        worker_dir = os.path.join(self.tmp, "worker")
+        self.assertTrue(self.abaqus_env.start_worker(worker_dir, args=self.worker_args, heartbeat_timeout=5.0))
+        received = []
+        self.abaqus_env.metrics = Metrics(sink=received.append)
+        try:
+            self.write_json("ok.json", {"job_status": "COMPLETED"})
+            status = self.abaqus_env.pre_solve_post(self.tmp, "ok.json")
+            self.assertTrue(status["ok"])
+            self.assertEqual(status["stage"], "done")
+            self.assertEqual([record["event"] for record in received], ["script", "pre_solve_post"])
+            self.assertEqual(received[0]["mode"], "worker")
+            self.assertEqual(received[1]["wall_time"], status["wall_time"])
+
+            self.write_json("aborted.json", {"job_status": "ABORTED"})
+            status = self.abaqus_env.pre_solve_post(self.tmp, "aborted.json")
+            self.assertFalse(status["ok"])
+            self.assertEqual(status["stage"], "solve")
+            self.assertEqual(status["job_status"], "ABORTED")
+
+            self.write_json("lost.json", {"no_status": True})
+            status = self.abaqus_env.pre_solve_post(self.tmp, "lost.json")
+            self.assertFalse(status["ok"])
+            self.assertIsNotNone(status["error"])
+        finally:
+            self.abaqus_env.stop_worker()
+
+    def fake_abaqus(self):
+        exe = os.path.join(self.tmp, "abaqus.sh")
+        with open(exe, "w") as f:
+            f.write(FAKE_ABAQUS)
+        os.chmod(exe, 0o755)
+        return exe
+
+    def child_alive(self, json_name):
+        with open(os.path.join(self.tmp, json_name + ".child")) as f:
+            pid = int(f.read())
+        try:
+            with open("/proc/%d/stat" % pid) as f:
+                # 被杀掉后没有被回收的僵尸进程也算已经结束
+                return f.read().split()[2] != "Z"
+        except IOError:
+            return False
+
+    @unittest.skipIf(not os.path.isdir("/proc"), "needs a POSIX shell and /proc")
+    def test_d_exec_script_streams_output(self):
+        with open(os.path.join(self.tmp, "fast.json"), "w") as f:
+            f.write("0")
+        ret = RunAbaqus.exec_script(self.fake_abaqus(), self.tmp, "stand_in.py", self.tmp, "fast.json",
+                                    abaqus_dir=self.tmp, timeout=30)
+        self.assertEqual(ret.exit_code, 3)
+        self.assertFalse(ret.ok)
+        self.assertFalse(ret.timed_out)
+        self.assertEqual(ret.log_path, self.tmp + "/fast.stand_in.log")
+        with open(ret.log_path, encoding="utf-8") as f:
+            log = f.read()
+        self.assertIn("start noGUI=%s/stand_in.py" % self.tmp, log)
+        self.assertIn("to stderr", log)
+        self.assertIn("done", log)
+        self.assertTrue(self.child_alive("fast.json"))
+        with open(os.path.join(self.tmp, "fast.json.child")) as f:
+            os.kill(int(f.read()), signal.SIGKILL)
+
+    @unittest.skipIf(not os.path.isdir("/proc"), "needs a POSIX shell and /proc")
+    def test_e_exec_script_timeout_and_cancel(self):
+        exe = self.fake_abaqus()
+        with open(os.path.join(self.tmp, "hung.json"), "w") as f:
+            f.write("60")
+        ret = RunAbaqus.exec_script(exe, self.tmp, "stand_in.py", self.tmp, "hung.json", abaqus_dir=self.tmp,
+                                    timeout=1.0)
+        self.assertTrue(ret.timed_out)
+        self.assertFalse(ret.ok)
+        self.assertLess(ret.duration, 10)
+        _time.sleep(0.2)
+        self.assertFalse(self.child_alive("hung.json"))
+
+        async def cancel():
+            task = asyncio.ensure_future(RunAbaqus.exec_script_async(
+                exe, self.tmp, "stand_in.py", self.tmp, "hung.json", abaqus_dir=self.tmp))
+            await asyncio.sleep(1.0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel())
+        _time.sleep(0.2)
+        self.assertFalse(self.child_alive("hung.json"))
+
+        # 解码输出出错
+        with self.assertRaises(LookupError):
+            asyncio.run(RunAbaqus.exec_script_async(exe, self.tmp, "stand_in.py", self.tmp, "hung.json",
+                                                    abaqus_dir=self.tmp, encoding="no-such-codec"))
+        _time.sleep(0.2)
+        self.assertFalse(self.child_alive("hung.json"))
+
+    def test_f_wait_for_busy_worker(self):
+        # 求解时心跳超时(CAE中心跳线程得不到执行), 已经领取的请求不能再用one-shot方式计算
+        worker_dir = os.path.join(self.tmp, "worker")
+        self.assertTrue(self.abaqus_env.start_worker(worker_dir, args=self.worker_args, heartbeat_timeout=5.0))
+
+        def stall_heartbeat():
+            while not any(name.endswith(".run") for name in os.listdir(worker_dir)):
+                _time.sleep(0.01)
+            self.abaqus_env.heartbeat_timeout = 0.0
+
+        stall = threading.Thread(target=stall_heartbeat)
+        stall.start()
+        try:
+            self.write_json("slow.json", {"sleep": 1.0})
+            self.assertTrue(self.abaqus_env.pre_process(self.tmp, "slow.json"))
+            stall.join()
+            self.assertTrue(os.path.exists(os.path.join(self.tmp, "slow.json.done")))
+            self.assertEqual(OneShotRecorder.calls, [])
+        finally:
+            self.abaqus_env.stop_worker()
+
+    def test_g_worker_dies_while_running(self):
+        # worker领取请求后退出, 作业算作失败, 不能一直等待, 也不能再用one-shot方式计算
+        worker_dir = os.path.join(self.tmp, "worker")
+        self.assertTrue(self.abaqus_env.start_worker(worker_dir, args=self.worker_args, heartbeat_timeout=5.0))
+
+        def kill_worker():
+            while not any(name.endswith(".run") for name in os.listdir(worker_dir)):
+                _time.sleep(0.01)
+            self.abaqus_env.worker_process.kill()
+
+        killer = threading.Thread(target=kill_worker)
+        killer.start()
+        results = []
+        self.write_json("slow.json", {"sleep": 5.0})
+        runner = threading.Thread(target=lambda: results.append(self.abaqus_env.pre_process(self.tmp, "slow.json")))
+        runner.daemon = True
+        runner.start()
+        runner.join(10.0)
+        killer.join()
+        try:
+            self.assertFalse(runner.is_alive())
+            self.assertEqual(len(results), 1)
+            self.assertFalse(results[0])
+            self.assertFalse(results[0].timed_out)
+            self.assertEqual(OneShotRecorder.calls, [])
+            self.assertFalse(self.abaqus_env.worker_alive())
+        finally:
+            self.abaqus_env.stop_worker()
+
+    def test_h_restart_clears_stale_requests(self):
+        worker_dir = os.path.join(self.tmp, "worker")
+        os.makedirs(worker_dir)
+        self.write_json("stale.json", {})
+        stale = {"script": self.tmp + "/stand_in.py", "json": self.tmp + "/stale.json", "cwd": self.tmp}
+        for name in ("old.req", "crashed.0123.run", "done.res", "heartbeat"):
+            with open(os.path.join(worker_dir, name), "w") as f:
+                f.write(json.dumps(stale))
+        # 旧的heartbeat和.run不能让没有启动的worker看起来还活着
+        self.abaqus_env.worker_dir = worker_dir
+        self.abaqus_env.heartbeat_timeout = 0.0
+        self.assertFalse(self.abaqus_env.worker_busy())
+        self.assertTrue(self.abaqus_env.start_worker(worker_dir, args=self.worker_args, heartbeat_timeout=5.0))
+        try:
+            self.assertFalse(self.abaqus_env.worker_busy())
+            self.assertEqual(sorted(os.listdir(worker_dir)), ["heartbeat"])
+            self.write_json("job.json", {})
+            self.assertTrue(self.abaqus_env.pre_process(self.tmp, "job.json"))
+            self.assertFalse(os.path.exists(os.path.join(self.tmp, "stale.json.done")))
+        finally:
+            self.abaqus_env.stop_worker()
+
+    def test_i_concurrent_timeouts(self):
+        # 共用一个RunAbaqus的多个线程同时超时, 后停止worker的线程不能因为worker_process已经为None而出错
+        worker_dir = os.path.join(self.tmp, "worker")
+        self.assertTrue(self.abaqus_env.start_worker(worker_dir, args=self.worker_args, heartbeat_timeout=5.0))
+        results, errors = [], []
+
+        def submit(k):
+            self.write_json("slow-%d.json" % k, {"sleep": 5.0})
+            try:
+                results.append(self.abaqus_env.submit("stand_in.py", self.tmp, "slow-%d.json" % k, timeout=0.5))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=submit, args=(k,)) for k in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 4)
+        for ret in results:
+            self.assertTrue(ret is None or ret.timed_out)
+        self.assertIsNone(self.abaqus_env.worker_process)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        super(RunAbaqusTest, self).tearDown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,9 @@ from __future__ import print_function
 
 import unittest
 
+import matplotlib.pyplot as plt
+from scipy.optimize import brenth
+
 from src.utils.run_abaqus import *
 from src.utils.utils import *
 
@@ -81,6 +84,103 @@ class UtilsTest(unittest.TestCase):
         json_file_name = self.json_2nd_name
         self.abaqus_env.post_process(json_path, json_file_name)
 
+    def test_f_RootMatchesScan(self):
+        # 逐点标量扫描的参考实现, 向量化后的Common.root必须给出相同的根
+        def scan_root(spl, y, start, stop, scan_step):
+            def func(x):
+                return spl(x) - y
+
+            out = []
+            for i in np.arange(start - 0.1, stop + 0.1, step=scan_step):
+                if (func(i) <= 0 < func(i + scan_step)) or (func(i) >= 0 > func(i + scan_step)):
+                    out.append((float(brenth(func, i, i + scan_step)), y))
+            if len(out) % 2 != 0 and len(out) > 1:
+                tmp = []
+                for p1, p2 in zip(out, out[1:]):
+                    if Common.distance(p1, p2) > 2.0:
+                        tmp.extend([p1, p2])
+                out = tmp[:]
+            if len(out) == 1:
+                out = []
+            return out
+
+        test = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        spl = Common.get_spl(test)
+        for y in np.arange(0.5, 14.0, 0.5):
+            self.assertEqual(Common.root(spl, y, 0, 40, scan_step=0.005), scan_root(spl, y, 0, 40, 0.005))
+
+    def test_g_YcoordPPolyMatchesScan(self):
+        test = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        spl = Common.get_spl(test)
+        scan = GenerateCoord.generate_ycoord(spl, 0, 40, 1.0, method="scan")
+        ppoly = GenerateCoord.generate_ycoord(spl, 0, 40, 1.0, method="ppoly")
+        self.assertEqual(len(scan), len(ppoly))
+        for pair_s, pair_p in zip(scan, ppoly):
+            for p_s, p_p in zip(pair_s, pair_p):
+                self.assertAlmostEqual(p_s[0], p_p[0], places=6)
+                self.assertAlmostEqual(p_s[1], p_p[1], places=9)
+
+    def test_h_IncoordMatchesCrossPoint(self):
+        test = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        tc = InitPlain(test)
+        expected = set()
+        for x_pair in tc.xcoord:
+            for y_pair in tc.ycoord:
+                pt = GenerateCoord.get_cross_point(x_pair[:], y_pair[:])
+                if pt is not None:
+                    expected.add(pt)
+        self.assertEqual(len(tc.incoord), len(expected))
+        self.assertEqual(set(tc.incoord), expected)
+
+    def test_i_SaveFigLeakFree(self):
+        import shutil
+        import tempfile
+        test = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        tc = InitPlain(test)
+        save_path = tempfile.mkdtemp()
+        try:
+            figures = plt.get_fignums()
+            tc.save_fig("sync", save_path)
+            worker = PlotWorker()
+            for i in range(3):
+                worker.submit(tc, "async-%d" % i, save_path)
+            worker.close()
+            self.assertEqual(plt.get_fignums(), figures)
+            self.assertEqual(sorted(os.listdir(save_path)), ["async-0.png", "async-1.png", "async-2.png", "sync.png"])
+        finally:
+            shutil.rmtree(save_path)
+
+    def test_j_IncrementalMatchesFull(self):
+        xs = np.linspace(0, 200, 51)
+        dense = list(zip(xs.tolist(), (60 * np.sin(np.pi * xs / 200) ** 0.5).tolist()))
+        dense[0], dense[-1] = (0.0, 0.0), (200.0, 0.0)
+        moved = list(dense)
+        moved[17] = (moved[17][0], moved[17][1] + 0.3)
+        test = [(0, 0), (2, 6.2), (10, 13), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        # 降低最高的控制点, 原来最高的几个y值不再有交点
+        lowered = [(0, 0), (2, 6.2), (10, 11), (20, 11.5), (30, 13), (38, 6.2), (40, 0)]
+        for method in ("scan", "ppoly"):
+            for before, after in ((dense, moved), (test, lowered), (lowered, test), (test, test)):
+                previous = InitPlain(before, method)
+                inc = InitPlain(after, method, previous=previous)
+                full = InitPlain(after, method)
+                # 沿用的杆件与完整生成相差在tol的量级, 内部点都在网格线上, 应该完全相同
+                for name in ("xcoord", "ycoord"):
+                    a, b = getattr(inc.layout, name), getattr(full.layout, name)
+                    self.assertEqual(a.shape, b.shape, name)
+                    self.assertTrue(np.allclose(a, b, rtol=0, atol=1e-5), name)
+                self.assertTrue(np.array_equal(inc.layout.incoord, full.layout.incoord))
+                self.assertEqual(len(inc.roots), len(full.roots))
+        previous = InitPlain(dense)
+        inc = InitPlain(moved, previous=previous)
+        full = InitPlain(moved)
+        # 移动51个控制点中的一个, 大部分杆件和几乎所有的内部点都应该沿用
+        self.assertLessEqual(inc.recomputed['xcoord'], 0.4 * full.recomputed['xcoord'])
+        self.assertLessEqual(inc.recomputed['levels'], 0.4 * full.recomputed['levels'])
+        self.assertLessEqual(inc.recomputed['incoord'], 0.02 * full.recomputed['incoord'])
+        # 边界变化时完整生成
+        self.assertEqual(InitPlain(test, previous=previous).recomputed, InitPlain(test).recomputed)
+
     def tearDown(self):
         super(UtilsTest, self).tearDown()
 